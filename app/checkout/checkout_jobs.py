@@ -0,0 +1,41 @@
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+from app.checkout.schemas import CheckoutResponseSchema
+
+# Checkouts accepted for asynchronous processing: ack token -> (expires_at, response).
+# The response has status "pending" until the PayPal order has been created.
+# Jobs live in this worker's memory only: a poll routed to another worker, or made
+# after a restart, finds nothing, so the async path is gated by PAYPAL_ASYNC_CHECKOUT.
+JOB_TTL_SECONDS = 900.0
+
+_JOBS: Dict[str, Tuple[float, CheckoutResponseSchema]] = {}
+
+
+def create_job(order_id: str) -> CheckoutResponseSchema:
+    """Register a pending checkout and return its pending response, carrying the ack token"""
+    now = time.monotonic()
+    for stale_token in [t for t, (expires_at, _) in _JOBS.items() if expires_at <= now]:
+        del _JOBS[stale_token]
+    pending = CheckoutResponseSchema(
+        success=True,
+        order_id=order_id,
+        status="pending",
+        message="Checkout accepted for processing",
+        ack_token=uuid.uuid4().hex
+    )
+    _JOBS[pending.ack_token] = (now + JOB_TTL_SECONDS, pending)
+    return pending
+
+
+def finish_job(ack_token: str, response: CheckoutResponseSchema):
+    """Store the outcome of a pending checkout"""
+    _JOBS[ack_token] = (time.monotonic() + JOB_TTL_SECONDS, response.model_copy(update={"ack_token": ack_token}))
+
+
+def get_job(ack_token: str) -> Optional[CheckoutResponseSchema]:
+    """Return the current response for an ack token, or None if unknown or expired"""
+    entry = _JOBS.get(ack_token)
+    if entry is None or entry[0] <= time.monotonic():
+        return None
+    return entry[1]
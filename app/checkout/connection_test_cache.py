@@ -0,0 +1,44 @@
+import time
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from app.checkout.single_flight import single_flight
+
+# Short-lived results of admin "test connection" calls, keyed by a hash of
+# provider, environment and credentials (raw credentials are never stored)
+SUCCESS_TTL_SECONDS = 60.0
+FAILURE_TTL_SECONDS = 5.0
+
+_CACHE: Dict[str, Tuple[float, Any]] = {}
+
+
+def credential_cache_key(provider: str, environment: str, *credentials: str) -> str:
+    """Build a cache key for a provider, environment and set of credentials"""
+    raw = "\0".join((provider, environment or "", *(c or "" for c in credentials)))
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+async def cached_test(
+    key: str,
+    coro_factory: Callable[[], Awaitable[Any]],
+    succeeded: Callable[[Any], bool]
+) -> Any:
+    """
+    Return a recent result for key, or run coro_factory and cache its result
+
+    Successful results are kept for SUCCESS_TTL_SECONDS and failures for
+    FAILURE_TTL_SECONDS, so a fixed credential error is noticed quickly.
+    Concurrent misses for the same key share a single provider call.
+    """
+    now = time.monotonic()
+    entry = _CACHE.get(key)
+    if entry is not None and now < entry[0]:
+        return entry[1]
+
+    result = await single_flight(key, coro_factory)
+
+    ttl = SUCCESS_TTL_SECONDS if succeeded(result) else FAILURE_TTL_SECONDS
+    now = time.monotonic()
+    for stale_key in [k for k, (expires_at, _) in _CACHE.items() if expires_at <= now]:
+        del _CACHE[stale_key]
+    _CACHE[key] = (now + ttl, result)
+    return result
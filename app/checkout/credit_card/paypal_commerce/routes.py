@@ -4,6 +4,7 @@ import logging
 from datetime import datetime
 import httpx
 import uuid
+from app.checkout.credit_card.paypal_commerce.test_routes import router as test_router
 
 router = APIRouter(
     tags=["PayPal Card Checkout"],
@@ -184,4 +185,7 @@ async def process_paypal_commerce_payment(request: Request):
         raise
     except Exception as e:
         logging.error(f"Unexpected error in process_paypal_commerce_payment: {e}")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}") 
+
+# Serve the test connection endpoint from the same router
+router.include_router(test_router, prefix="")
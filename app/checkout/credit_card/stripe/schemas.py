@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field, validator, model_validator
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, Field, SkipValidation, StringConstraints, validator, model_validator
+from typing import Annotated, Optional, List, Dict, Any
+from typing_extensions import NotRequired, TypedDict
 from decimal import Decimal
 from datetime import datetime
 from enum import Enum
@@ -33,12 +34,20 @@ class StripeCardBrand(str, Enum):
     UNIONPAY = "unionpay"
 
 
+# Phone number: trimmed, 7-20 chars of digits, spaces, dashes and parentheses
+# with an optional leading '+'. Checked in a single pydantic-core pass.
+PhoneNumber = Annotated[
+    str,
+    StringConstraints(strip_whitespace=True, min_length=7, max_length=20, pattern=r'^\+?[0-9\- ()]+$')
+]
+
+
 class CustomerSchema(BaseModel):
     """Customer information schema"""
     email: str = Field(..., description="Customer email address")
     first_name: str = Field(..., min_length=1, max_length=100, description="Customer first name")
     last_name: str = Field(..., min_length=1, max_length=100, description="Customer last name")
-    phone: Optional[str] = Field(None, max_length=20, description="Customer phone number")
+    phone: Optional[PhoneNumber] = Field(None, description="Customer phone number")
     metadata: Optional[Dict[str, str]] = Field(default_factory=dict, description="Additional customer metadata")
 
 
@@ -58,18 +67,19 @@ class AddressSchema(BaseModel):
         return v.upper()
 
 
-class OrderItemSchema(BaseModel):
-    """Order item schema"""
-    product_id: str = Field(..., description="Product identifier")
-    name: str = Field(..., min_length=1, max_length=255, description="Product name")
-    quantity: int = Field(..., gt=0, le=999, description="Item quantity")
-    unit_price: Decimal = Field(..., gt=0, description="Unit price in smallest currency unit")
-    currency: str = Field(default="usd", min_length=3, max_length=3, description="Currency code")
-    metadata: Optional[Dict[str, str]] = Field(default_factory=dict, description="Additional item metadata")
+class OrderItemSchema(TypedDict):
+    """
+    Order item schema
 
-    @validator('currency')
-    def validate_currency(cls, v):
-        return v.lower()
+    A TypedDict rather than a model so the whole items list is validated
+    in one pydantic-core pass without building an instance per item.
+    """
+    product_id: str
+    name: Annotated[str, StringConstraints(min_length=1, max_length=255)]
+    quantity: Annotated[int, Field(gt=0, le=999)]
+    unit_price: Annotated[Decimal, Field(gt=0)]
+    currency: NotRequired[Annotated[str, StringConstraints(min_length=3, max_length=3, to_lower=True)]]
+    metadata: NotRequired[Optional[Dict[str, str]]]
 
 
 class StripePaymentMethodSchema(BaseModel):
@@ -112,7 +122,7 @@ class StripeCheckoutRequestSchema(BaseModel):
     """Complete Stripe checkout request schema"""
     order_id: str = Field(..., min_length=1, max_length=255, description="Unique order identifier")
     customer: CustomerSchema = Field(..., description="Customer information")
-    items: List[OrderItemSchema] = Field(..., min_items=1, max_items=100, description="Order items")
+    items: List[OrderItemSchema] = Field(..., min_length=1, max_length=100, description="Order items")
     shipping_address: AddressSchema = Field(..., description="Shipping address")
     billing_address: Optional[AddressSchema] = Field(None, description="Billing address (uses shipping if not provided)")
     subtotal: Decimal = Field(..., gt=0, description="Order subtotal in smallest currency unit")
@@ -175,7 +185,7 @@ class StripeCustomerSchema(BaseModel):
     id: str = Field(..., description="Customer ID")
     email: str = Field(..., description="Customer email")
     name: Optional[str] = Field(None, description="Customer full name")
-    phone: Optional[str] = Field(None, description="Customer phone")
+    phone: Optional[PhoneNumber] = Field(None, description="Customer phone")
     created: datetime = Field(..., description="Creation timestamp")
     metadata: Dict[str, str] = Field(default_factory=dict, description="Customer metadata")
 
@@ -234,14 +244,19 @@ class StripeRefundResponseSchema(BaseModel):
 
 
 class StripeWebhookEventSchema(BaseModel):
-    """Stripe webhook event schema"""
+    """
+    Stripe webhook event schema
+
+    Caller MUST verify the webhook signature before instantiating: the
+    ``data`` and ``request`` payloads are passed through without validation.
+    """
     id: str = Field(..., description="Event ID")
     type: str = Field(..., description="Event type")
-    data: Dict[str, Any] = Field(..., description="Event data")
+    data: SkipValidation[Dict[str, Any]] = Field(..., description="Event data (trusted after signature verification)")
     created: datetime = Field(..., description="Event creation timestamp")
     livemode: bool = Field(..., description="Whether event is from live mode")
     api_version: Optional[str] = Field(None, description="API version")
-    request: Optional[Dict[str, Any]] = Field(None, description="Request details")
+    request: SkipValidation[Optional[Dict[str, Any]]] = Field(None, description="Request details")
 
 
 class StripeErrorSchema(BaseModel):
@@ -1,12 +1,20 @@
 import os
 import json
+import time
 import logging
 import asyncio
+import functools
+import hashlib
+import hmac
+from collections import OrderedDict
 from typing import Dict, Any, Optional, List, Tuple
 from decimal import Decimal
 import stripe
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import httpx
+import orjson
+from urllib.parse import quote_plus
+from app.checkout.http_client import get_http_client, send_with_retry
 from .schemas import (
     StripeCheckoutRequestSchema,
     StripeCheckoutResponseSchema,
@@ -22,10 +30,163 @@ from .schemas import (
     PaymentMethodType
 )
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Stripe API constants
+STRIPE_API_BASE = "https://api.stripe.com"
+STRIPE_API_VERSION = "2024-12-18.acacia"
+_EP_PAYMENT_INTENTS = "/v1/payment_intents"
+_EP_REFUNDS = "/v1/refunds"
+_EP_CUSTOMERS = "/v1/customers"
+_EP_PAYMENT_METHODS = "/v1/payment_methods"
+_EP_ACCOUNT = "/v1/account"
+
+# Content type for the form-encoded bodies Stripe expects
+_FORM_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+
+# Maximum number of response body bytes decoded for log-only error messages
+ERROR_BODY_LOG_LIMIT = 512
+
+# Maximum age of a webhook signature timestamp, matching Stripe's SDK default
+WEBHOOK_TOLERANCE_SECONDS = 300
+
+# Map test card numbers to their corresponding test tokens
+STRIPE_TEST_TOKENS: Dict[str, str] = {
+    '4242424242424242': 'tok_visa',
+    '4000056655665556': 'tok_visa_debit',
+    '5555555555554444': 'tok_mastercard',
+    '2223003122003222': 'tok_mastercard_debit',
+    '5200828282828210': 'tok_mastercard_prepaid',
+    '5105105105105100': 'tok_mastercard',
+    '378282246310005': 'tok_amex',
+    '371449635398431': 'tok_amex',
+    '6011111111111117': 'tok_discover',
+    '3056930009020004': 'tok_diners',
+    '3566002020360505': 'tok_jcb',
+    '6200000000000005': 'tok_unionpay'
+}
+
+# Form keys sent when creating a Stripe customer
+_CUSTOMER_KEYS = ('email', 'name', 'phone', 'metadata[first_name]', 'metadata[last_name]')
+
+# Customer lookup cache (email -> customer info) bounds
+CUSTOMER_CACHE_MAX_SIZE = 10_000
+CUSTOMER_CACHE_TTL_SECONDS = 600
+
+
+_UTC = timezone.utc
+
+
+@functools.lru_cache(maxsize=4096)
+def _ts_to_dt(ts: int) -> datetime:
+    """Convert a Stripe unix timestamp to an aware UTC datetime"""
+    return datetime.fromtimestamp(ts, _UTC)
+
+
+def _idempotency_key(prefix: str, discriminator: str, params: Dict[str, Any], secret: Optional[str] = None) -> str:
+    """
+    Build a deterministic Stripe Idempotency-Key for a POST
+    
+    The key includes a hash of all params: Stripe rejects a replayed key whose
+    params differ with an idempotency_error, so a key must never be shared by
+    two different requests. Pass a secret to key the hash when params hold
+    card data.
+    """
+    body = orjson.dumps(params, option=orjson.OPT_SORT_KEYS)
+    if secret is None:
+        digest = hashlib.sha256(body).hexdigest()[:16]
+    else:
+        digest = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()[:16]
+    return f"{prefix}:{discriminator}:{digest}"
+
+
+def _stripe_error_type(response: httpx.Response) -> Optional[str]:
+    """Return the ``error.type`` of a Stripe error response, if it has one"""
+    try:
+        return _parse_json(response).get('error', {}).get('type')
+    except (ValueError, AttributeError):
+        return None
+
+
+@functools.lru_cache(maxsize=512)
+def _quote_form_key(key: str) -> str:
+    """URL-encode a form key; the bracketed Stripe keys are mostly static, so cache them"""
+    return quote_plus(key)
+
+
+def _form_value(value: Any) -> str:
+    """Coerce a form value to a string the way httpx does"""
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if value is None:
+        return ''
+    return str(value)
+
+
+def _form_encode(params: Dict[str, Any]) -> bytes:
+    """Encode flat Stripe parameters as an application/x-www-form-urlencoded body"""
+    return '&'.join([
+        f"{_quote_form_key(key)}={quote_plus(_form_value(value))}"
+        for key, value in params.items()
+    ]).encode()
+
+
+def _parse_json(response: httpx.Response) -> Any:
+    """Parse a Stripe JSON response body with orjson"""
+    return orjson.loads(response.content)
+
+
+def _payment_intent_from_stripe(d: Dict[str, Any]) -> StripePaymentIntentSchema:
+    """Build a PaymentIntent schema from a trusted Stripe PaymentIntent JSON object"""
+    return StripePaymentIntentSchema.model_construct(
+        id=d['id'],
+        client_secret=d['client_secret'],
+        status=StripePaymentIntentStatus(d['status']),
+        amount=d['amount'],
+        currency=d['currency'],
+        created=_ts_to_dt(d['created']),
+        metadata=d.get('metadata', {}),
+        next_action=d.get('next_action'),
+        payment_method_types=d.get('payment_method_types', [])
+    )
+
+
+def _body_for_log(response: httpx.Response) -> str:
+    """Decode at most ERROR_BODY_LOG_LIMIT bytes of a response body for logging"""
+    return response.content[:ERROR_BODY_LOG_LIMIT].decode('utf-8', 'replace')
+
+
+class StripeAPIError(Exception):
+    """Raised when Stripe rejects a request made on behalf of a checkout"""
+
+
+class _StripeCustomerView:
+    """Lightweight view over a Stripe Customer JSON object"""
+    __slots__ = ("id", "email", "name", "phone", "created", "metadata")
+    
+    def __init__(self, customer_data: Dict[str, Any]):
+        self.id = customer_data['id']
+        self.email = customer_data['email']
+        self.name = customer_data.get('name')
+        self.phone = customer_data.get('phone')
+        self.created = customer_data['created']
+        self.metadata = customer_data.get('metadata', {})
+
+
+class _StripePaymentMethodView:
+    """Lightweight view over a Stripe PaymentMethod JSON object"""
+    __slots__ = ("id", "type", "card", "billing_details", "created", "customer")
+    
+    def __init__(self, payment_method_data: Dict[str, Any]):
+        self.id = payment_method_data['id']
+        self.type = payment_method_data['type']
+        self.card = payment_method_data.get('card')
+        self.billing_details = payment_method_data.get('billing_details')
+        self.created = payment_method_data['created']
+        self.customer = payment_method_data.get('customer')
+
 
 class StripeService:
     """Production-ready Stripe payment processing service"""
@@ -48,13 +209,44 @@ class StripeService:
         stripe.api_key = api_key
         
         # Set API version for consistency
-        stripe.api_version = '2024-12-18.acacia'
+        stripe.api_version = STRIPE_API_VERSION
+        
+        # Requests go through the shared pooled client (app.checkout.http_client),
+        # so only the per-key headers live on the service
+        self._auth_headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Stripe-Version": STRIPE_API_VERSION
+        }
+        self._form_headers = {**_FORM_HEADERS, **self._auth_headers}
         
-        # Configure logging for Stripe
-        stripe.log = 'info'
+        # email -> (cached_at, customer info), oldest first
+        self._customer_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
         
-        logger.info(f"Stripe service initialized with API version: {stripe.api_version}")
-        logger.info(f"API key configured: {api_key[:10]}...{api_key[-4:] if len(api_key) > 14 else '***'}")
+        logger.info("Stripe service initialized with API version: %s", stripe.api_version)
+        logger.info("API key configured: %s...%s", api_key[:10], api_key[-4:] if len(api_key) > 14 else '***')
+    
+    async def _post_form(
+        self,
+        path: str,
+        params: Dict[str, Any],
+        timeout: float,
+        headers: Optional[Dict[str, str]] = None
+    ) -> httpx.Response:
+        """
+        POST form-encoded parameters to a Stripe endpoint
+        
+        Requests carrying an Idempotency-Key are safe to replay, so only those
+        are retried on all transient failures; others only when they could not connect.
+        """
+        client = await get_http_client()
+        send = functools.partial(
+            client.post,
+            STRIPE_API_BASE + path,
+            content=_form_encode(params),
+            headers={**self._form_headers, **headers} if headers else self._form_headers,
+            timeout=timeout
+        )
+        return await send_with_retry(send, idempotent=bool(headers and "Idempotency-Key" in headers))
     
     async def create_payment_intent(
         self, 
@@ -72,17 +264,20 @@ class StripeService:
             StripeCheckoutResponseSchema with payment intent details
         """
         try:
-            logger.info(f"Creating PaymentIntent for order: {request.order_id}")
-            
-            # Create or retrieve customer
-            customer = await self._get_or_create_customer(request.customer)
-            logger.info(f"Customer created/found: {customer.id}")
+            logger.info("Creating PaymentIntent for order: %s", request.order_id)
             
-            # Create payment method
-            payment_method = await self._create_payment_method(request.payment_method, customer.id)
-            logger.info(f"PaymentMethod created: {payment_method.id}")
+            # Create or retrieve customer and create payment method concurrently;
+            # the PaymentMethod is attached to the customer by the PaymentIntent
+            customer, payment_method = await asyncio.gather(
+                self._get_or_create_customer(request.customer),
+                self._create_payment_method_detached(request.payment_method, request.order_id)
+            )
+            logger.info("Customer created/found: %s", customer.id)
+            logger.info("PaymentMethod created: %s", payment_method.id)
             
             # Prepare PaymentIntent parameters
+            items_count = len(request.items)
+            full_name = f"{request.customer.first_name} {request.customer.last_name}"
             payment_intent_params = {
                 'amount': int(request.total_amount),  # Convert to cents
                 'currency': request.currency.lower(),
@@ -90,111 +285,111 @@ class StripeService:
                 'payment_method': payment_method.id,
                 'confirmation_method': 'manual',
                 'confirm': True,
-                'description': f"Order {request.order_id} - {len(request.items)} items",
+                'description': f"Order {request.order_id} - {items_count} items",
                 'receipt_email': request.customer.email,
                 'metadata[order_id]': request.order_id,
                 'metadata[customer_email]': request.customer.email,
-                'metadata[items_count]': str(len(request.items)),
+                'metadata[items_count]': str(items_count),
                 # Configure automatic payment methods to prevent redirects
                 'automatic_payment_methods[enabled]': 'true',
                 'automatic_payment_methods[allow_redirects]': 'never'
             }
             
             # Add shipping address if provided
-            if request.shipping_address:
-                payment_intent_params.update({
-                    'shipping[name]': f"{request.customer.first_name} {request.customer.last_name}",
-                    'shipping[address][line1]': request.shipping_address.line1,
-                    'shipping[address][line2]': request.shipping_address.line2 or '',
-                    'shipping[address][city]': request.shipping_address.city,
-                    'shipping[address][state]': request.shipping_address.state,
-                    'shipping[address][postal_code]': request.shipping_address.postal_code,
-                    'shipping[address][country]': request.shipping_address.country_code.upper()
-                })
+            shipping_address = request.shipping_address
+            if shipping_address:
+                p = payment_intent_params
+                p['shipping[name]'] = full_name
+                p['shipping[address][line1]'] = shipping_address.line1
+                p['shipping[address][line2]'] = shipping_address.line2 or ''
+                p['shipping[address][city]'] = shipping_address.city
+                p['shipping[address][state]'] = shipping_address.state
+                p['shipping[address][postal_code]'] = shipping_address.postal_code
+                p['shipping[address][country]'] = shipping_address.country_code.upper()
+            
+            # Only cards the customer chose to save are attached to them for later
+            # off-session charges
+            if request.payment_method.save_payment_method:
+                payment_intent_params['setup_future_usage'] = 'off_session'
             
             # Add return_url if provided
             if request.return_url:
                 payment_intent_params['return_url'] = request.return_url
             
             # Create PaymentIntent using direct HTTP request for reliability
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "https://api.stripe.com/v1/payment_intents",
-                    data=payment_intent_params,
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Stripe-Version": "2024-12-18.acacia"
-                    },
-                    timeout=30.0
-                )
-                
-                if response.status_code != 200:
-                    error_text = response.text
-                    logger.error(f"PaymentIntent creation failed: {error_text}")
-                    return self._create_error_response(
-                        request.order_id,
-                        f"Failed to create payment intent: {error_text}",
-                        "payment_intent_creation_failed"
-                    )
-                
-                payment_intent_data = response.json()
-                logger.info(f"PaymentIntent created: {payment_intent_data['id']} with status: {payment_intent_data['status']}")
-                
-                # Create response schema
-                payment_intent = StripePaymentIntentSchema(
-                    id=payment_intent_data['id'],
-                    client_secret=payment_intent_data['client_secret'],
-                    status=payment_intent_data['status'],
-                    amount=payment_intent_data['amount'],
-                    currency=payment_intent_data['currency'],
-                    created=datetime.fromtimestamp(payment_intent_data['created']),
-                    metadata=payment_intent_data.get('metadata', {}),
-                    next_action=payment_intent_data.get('next_action'),
-                    payment_method_types=payment_intent_data.get('payment_method_types', [])
-                )
-                
-                # Create customer schema
-                customer_schema = StripeCustomerSchema(
-                    id=customer.id,
-                    email=customer.email,
-                    name=f"{request.customer.first_name} {request.customer.last_name}",
-                    phone=request.customer.phone,
-                    created=datetime.fromtimestamp(customer.created),
-                    metadata=customer.metadata
-                )
-                
-                # Create payment method schema
-                payment_method_schema = StripePaymentMethodResponseSchema(
-                    id=payment_method.id,
-                    type=payment_method.type,
-                    card=payment_method.card,
-                    billing_details=payment_method.billing_details,
-                    created=datetime.fromtimestamp(payment_method.created),
-                    customer=customer.id
+            response = await self._post_form(
+                _EP_PAYMENT_INTENTS,
+                payment_intent_params,
+                # A retry with the same card reuses the same PaymentMethod and so replays
+                # this PaymentIntent; a retry with another card is a new payment attempt
+                headers={"Idempotency-Key": _idempotency_key("pi", request.order_id, payment_intent_params)},
+                timeout=30.0
+            )
+            
+            if response.status_code != 200 and _stripe_error_type(response) == 'idempotency_error':
+                logger.error("PaymentIntent idempotency conflict for order %s: %s", request.order_id, _body_for_log(response))
+                return self._create_error_response(
+                    request.order_id,
+                    "A payment with different details is already in progress for this order",
+                    "idempotency_error"
                 )
-                
-                return StripeCheckoutResponseSchema(
-                    success=True,
-                    payment_intent=payment_intent,
-                    payment_method=payment_method_schema,
-                    customer=customer_schema,
-                    order_id=request.order_id,
-                    amount=payment_intent_data['amount'],
-                    currency=payment_intent_data['currency'],
-                    status=payment_intent_data['status'],
-                    message="Payment intent created successfully",
-                    requires_action=payment_intent_data['status'] == 'requires_action',
-                    next_action=payment_intent_data.get('next_action'),
-                    timestamp=datetime.utcnow()
+            
+            if response.status_code != 200:
+                error_text = response.text
+                logger.error("PaymentIntent creation failed: %s", error_text)
+                return self._create_error_response(
+                    request.order_id,
+                    f"Failed to create payment intent: {error_text}",
+                    "payment_intent_creation_failed"
                 )
-                
-        except Exception as e:
-            logger.error(f"Error creating payment intent: {e}")
+            
+            # An unknown status or missing field fails the checkout like a bad response
+            payment_intent = _payment_intent_from_stripe(_parse_json(response))
+            
+        except (httpx.HTTPError, StripeAPIError, ValueError, KeyError) as e:
+            logger.error("Error creating payment intent: %s", e)
             return self._create_error_response(
                 request.order_id,
                 f"Error creating payment intent: {str(e)}",
                 "payment_intent_error"
             )
+        
+        logger.info("PaymentIntent created: %s with status: %s", payment_intent.id, payment_intent.status.value)
+        
+        # Create customer schema
+        customer_schema = StripeCustomerSchema.model_construct(
+            id=customer.id,
+            email=customer.email,
+            name=full_name,
+            phone=request.customer.phone,
+            created=_ts_to_dt(customer.created),
+            metadata=customer.metadata
+        )
+        
+        # Create payment method schema
+        payment_method_schema = StripePaymentMethodResponseSchema.model_construct(
+            id=payment_method.id,
+            type=payment_method.type,
+            card=payment_method.card,
+            billing_details=payment_method.billing_details,
+            created=_ts_to_dt(payment_method.created),
+            customer=customer.id
+        )
+        
+        return StripeCheckoutResponseSchema.model_construct(
+            success=True,
+            payment_intent=payment_intent,
+            payment_method=payment_method_schema,
+            customer=customer_schema,
+            order_id=request.order_id,
+            amount=payment_intent.amount,
+            currency=payment_intent.currency,
+            status=payment_intent.status.value,
+            message="Payment intent created successfully",
+            requires_action=payment_intent.status is StripePaymentIntentStatus.REQUIRES_ACTION,
+            next_action=payment_intent.next_action,
+            timestamp=datetime.now(_UTC)
+        )
     
     async def confirm_payment_intent(
         self, 
@@ -210,7 +405,7 @@ class StripeService:
             StripePaymentConfirmResponseSchema with confirmation details
         """
         try:
-            logger.info(f"Confirming PaymentIntent: {request.payment_intent_id}")
+            logger.info("Confirming PaymentIntent: %s", request.payment_intent_id)
             
             # Prepare confirmation parameters
             confirm_params = {}
@@ -222,61 +417,44 @@ class StripeService:
                 confirm_params['return_url'] = request.return_url
             
             # Confirm PaymentIntent using direct HTTP request
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"https://api.stripe.com/v1/payment_intents/{request.payment_intent_id}/confirm",
-                    data=confirm_params,
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Stripe-Version": "2024-12-18.acacia"
-                    },
-                    timeout=30.0
-                )
-                
-                if response.status_code != 200:
-                    error_text = response.text
-                    logger.error(f"PaymentIntent confirmation failed: {error_text}")
-                    return StripePaymentConfirmResponseSchema(
-                        success=False,
-                        status="failed",
-                        message=f"Payment confirmation failed: {error_text}",
-                        error=error_text,
-                        timestamp=datetime.utcnow()
-                    )
-                
-                payment_intent_data = response.json()
-                logger.info(f"PaymentIntent confirmed: {payment_intent_data['id']} with status: {payment_intent_data['status']}")
-                
-                # Create payment intent schema
-                payment_intent = StripePaymentIntentSchema(
-                    id=payment_intent_data['id'],
-                    client_secret=payment_intent_data['client_secret'],
-                    status=payment_intent_data['status'],
-                    amount=payment_intent_data['amount'],
-                    currency=payment_intent_data['currency'],
-                    created=datetime.fromtimestamp(payment_intent_data['created']),
-                    metadata=payment_intent_data.get('metadata', {}),
-                    next_action=payment_intent_data.get('next_action'),
-                    payment_method_types=payment_intent_data.get('payment_method_types', [])
-                )
-                
+            response = await self._post_form(
+                f"{_EP_PAYMENT_INTENTS}/{request.payment_intent_id}/confirm",
+                confirm_params,
+                timeout=30.0
+            )
+            
+            if response.status_code != 200:
+                error_text = response.text
+                logger.error("PaymentIntent confirmation failed: %s", error_text)
                 return StripePaymentConfirmResponseSchema(
-                    success=True,
-                    payment_intent=payment_intent,
-                    status=payment_intent_data['status'],
-                    message="Payment confirmed successfully",
-                    timestamp=datetime.utcnow()
+                    success=False,
+                    status="failed",
+                    message=f"Payment confirmation failed: {error_text}",
+                    error=error_text,
+                    timestamp=datetime.now(_UTC)
                 )
-                
-        except Exception as e:
-            logger.error(f"Error confirming payment intent: {e}")
+            
+            payment_intent = _payment_intent_from_stripe(_parse_json(response))
+            
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            logger.error("Error confirming payment intent: %s", e)
             return StripePaymentConfirmResponseSchema(
                 success=False,
                 status="failed",
                 message=f"Error confirming payment: {str(e)}",
                 error=str(e),
-                timestamp=datetime.utcnow()
+                timestamp=datetime.now(_UTC)
             )
+        
+        logger.info("PaymentIntent confirmed: %s with status: %s", payment_intent.id, payment_intent.status.value)
+        
+        return StripePaymentConfirmResponseSchema(
+            success=True,
+            payment_intent=payment_intent,
+            status=payment_intent.status.value,
+            message="Payment confirmed successfully",
+            timestamp=datetime.now(_UTC)
+        )
     
     async def refund_payment(
         self, 
@@ -292,21 +470,11 @@ class StripeService:
             StripeRefundResponseSchema with refund details
         """
         try:
-            logger.info(f"Processing refund for PaymentIntent: {request.payment_intent_id}")
+            logger.info("Processing refund for PaymentIntent: %s", request.payment_intent_id)
             
-            # Get the PaymentIntent to find the charge
-            payment_intent = await self.get_payment_intent(request.payment_intent_id)
-            if not payment_intent:
-                return StripeRefundResponseSchema(
-                    success=False,
-                    status="failed",
-                    message="PaymentIntent not found",
-                    error="PaymentIntent not found",
-                    timestamp=datetime.utcnow()
-                )
-            
-            # Prepare refund parameters
-            refund_params = {}
+            # Prepare refund parameters; Stripe rejects an unknown PaymentIntent
+            # itself, so no preflight lookup is needed
+            refund_params = {'payment_intent': request.payment_intent_id}
             
             if request.amount:
                 refund_params['amount'] = request.amount
@@ -319,49 +487,54 @@ class StripeService:
                     refund_params[f'metadata[{key}]'] = value
             
             # Create refund using direct HTTP request
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "https://api.stripe.com/v1/refunds",
-                    data=refund_params,
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Stripe-Version": "2024-12-18.acacia"
-                    },
-                    timeout=30.0
-                )
-                
-                if response.status_code != 200:
-                    error_text = response.text
-                    logger.error(f"Refund creation failed: {error_text}")
+            response = await self._post_form(
+                _EP_REFUNDS,
+                refund_params,
+                headers={"Idempotency-Key": _idempotency_key("rf", request.payment_intent_id, refund_params)},
+                timeout=30.0
+            )
+            
+            if response.status_code != 200:
+                error_text = response.text
+                logger.error("Refund creation failed: %s", error_text)
+                if self._is_payment_intent_missing(response):
                     return StripeRefundResponseSchema(
                         success=False,
                         status="failed",
-                        message=f"Refund failed: {error_text}",
-                        error=error_text,
-                        timestamp=datetime.utcnow()
+                        message="PaymentIntent not found",
+                        error="PaymentIntent not found",
+                        timestamp=datetime.now(_UTC)
                     )
-                
-                refund_data = response.json()
-                logger.info(f"Refund created: {refund_data['id']} with status: {refund_data['status']}")
-                
                 return StripeRefundResponseSchema(
-                    success=True,
-                    refund_id=refund_data['id'],
-                    amount=refund_data['amount'],
-                    status=refund_data['status'],
-                    message="Refund processed successfully",
-                    timestamp=datetime.utcnow()
+                    success=False,
+                    status="failed",
+                    message=f"Refund failed: {error_text}",
+                    error=error_text,
+                    timestamp=datetime.now(_UTC)
                 )
-                
-        except Exception as e:
-            logger.error(f"Error processing refund: {e}")
+            
+            refund_data = _parse_json(response)
+            
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error("Error processing refund: %s", e)
             return StripeRefundResponseSchema(
                 success=False,
                 status="failed",
                 message=f"Error processing refund: {str(e)}",
                 error=str(e),
-                timestamp=datetime.utcnow()
+                timestamp=datetime.now(_UTC)
             )
+        
+        logger.info("Refund created: %s with status: %s", refund_data['id'], refund_data['status'])
+        
+        return StripeRefundResponseSchema(
+            success=True,
+            refund_id=refund_data['id'],
+            amount=refund_data['amount'],
+            status=refund_data['status'],
+            message="Refund processed successfully",
+            timestamp=datetime.now(_UTC)
+        )
     
     async def get_payment_intent(self, payment_intent_id: str) -> Optional[StripePaymentIntentSchema]:
         """
@@ -374,44 +547,33 @@ class StripeService:
             StripePaymentIntentSchema or None if not found
         """
         try:
-            logger.info(f"Retrieving PaymentIntent: {payment_intent_id}")
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"https://api.stripe.com/v1/payment_intents/{payment_intent_id}",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Stripe-Version": "2024-12-18.acacia"
-                    },
-                    timeout=10.0
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Failed to retrieve PaymentIntent: {response.text}")
-                    return None
-                
-                payment_intent_data = response.json()
-                
-                return StripePaymentIntentSchema(
-                    id=payment_intent_data['id'],
-                    client_secret=payment_intent_data['client_secret'],
-                    status=payment_intent_data['status'],
-                    amount=payment_intent_data['amount'],
-                    currency=payment_intent_data['currency'],
-                    created=datetime.fromtimestamp(payment_intent_data['created']),
-                    metadata=payment_intent_data.get('metadata', {}),
-                    next_action=payment_intent_data.get('next_action'),
-                    payment_method_types=payment_intent_data.get('payment_method_types', [])
-                )
-                
-        except Exception as e:
-            logger.error(f"Error retrieving PaymentIntent: {e}")
+            logger.info("Retrieving PaymentIntent: %s", payment_intent_id)
+            
+            client = await get_http_client()
+            response = await send_with_retry(functools.partial(
+                client.get,
+                f"{STRIPE_API_BASE}{_EP_PAYMENT_INTENTS}/{payment_intent_id}",
+                headers=self._auth_headers,
+                timeout=10.0
+            ))
+            
+            if response.status_code != 200:
+                logger.error("Failed to retrieve PaymentIntent: %s", _body_for_log(response))
+                return None
+            
+            return _payment_intent_from_stripe(_parse_json(response))
+            
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            logger.error("Error retrieving PaymentIntent: %s", e)
             return None
     
-    async def _get_or_create_customer(self, customer_data) -> stripe.Customer:
+    async def _get_or_create_customer(self, customer_data) -> _StripeCustomerView:
         """
         Get or create a Stripe customer
         
+        Customers are cached by email for CUSTOMER_CACHE_TTL_SECONDS so
+        returning shoppers skip the lookup round trip.
+        
         Args:
             customer_data: Customer information
             
@@ -419,182 +581,150 @@ class StripeService:
             Stripe Customer object
         """
         try:
+            cached_info = self._get_cached_customer(customer_data.email)
+            if cached_info is not None:
+                logger.info("Using cached customer: %s", cached_info['id'])
+                return _StripeCustomerView(cached_info)
+            
             # Try to find existing customer by email
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    "https://api.stripe.com/v1/customers",
-                    params={'email': customer_data.email},
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Stripe-Version": "2024-12-18.acacia"
-                    },
-                    timeout=10.0
-                )
-                
-                if response.status_code == 200:
-                    customers_data = response.json()
-                    if customers_data['data']:
-                        # Return existing customer
-                        customer_info = customers_data['data'][0]
-                        logger.info(f"Found existing customer: {customer_info['id']}")
-                        
-                        # Create mock customer object
-                        class MockCustomer:
-                            def __init__(self, customer_data):
-                                self.id = customer_data['id']
-                                self.email = customer_data['email']
-                                self.name = customer_data.get('name')
-                                self.phone = customer_data.get('phone')
-                                self.created = customer_data['created']
-                                self.metadata = customer_data.get('metadata', {})
-                        
-                        return MockCustomer(customer_info)
-                
-                # Create new customer
-                customer_params = {
-                    'email': customer_data.email,
-                    'name': f"{customer_data.first_name} {customer_data.last_name}",
-                    'phone': customer_data.phone,
-                    'metadata[first_name]': customer_data.first_name,
-                    'metadata[last_name]': customer_data.last_name
-                }
-                
-                response = await client.post(
-                    "https://api.stripe.com/v1/customers",
-                    data=customer_params,
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Stripe-Version": "2024-12-18.acacia"
-                    },
-                    timeout=10.0
-                )
-                
-                if response.status_code != 200:
-                    error_text = response.text
-                    logger.error(f"Customer creation failed: {error_text}")
-                    raise Exception(f"Failed to create customer: {error_text}")
-                
-                customer_info = response.json()
-                logger.info(f"Created new customer: {customer_info['id']}")
-                
-                # Create mock customer object
-                class MockCustomer:
-                    def __init__(self, customer_data):
-                        self.id = customer_data['id']
-                        self.email = customer_data['email']
-                        self.name = customer_data.get('name')
-                        self.phone = customer_data.get('phone')
-                        self.created = customer_data['created']
-                        self.metadata = customer_data.get('metadata', {})
-                
-                return MockCustomer(customer_info)
-                
-        except Exception as e:
-            logger.error(f"Error in _get_or_create_customer: {e}")
+            client = await get_http_client()
+            response = await send_with_retry(functools.partial(
+                client.get,
+                STRIPE_API_BASE + _EP_CUSTOMERS,
+                params={'email': customer_data.email},
+                headers=self._auth_headers,
+                timeout=10.0
+            ))
+            
+            if response.status_code == 200:
+                customers_data = _parse_json(response)
+                if customers_data['data']:
+                    # Return existing customer
+                    customer_info = customers_data['data'][0]
+                    logger.info("Found existing customer: %s", customer_info['id'])
+                    self._cache_customer(customer_data.email, customer_info)
+                    return _StripeCustomerView(customer_info)
+            
+            # Create new customer
+            customer_params = dict.fromkeys(_CUSTOMER_KEYS)
+            customer_params['email'] = customer_data.email
+            customer_params['name'] = f"{customer_data.first_name} {customer_data.last_name}"
+            customer_params['phone'] = customer_data.phone
+            customer_params['metadata[first_name]'] = customer_data.first_name
+            customer_params['metadata[last_name]'] = customer_data.last_name
+            
+            response = await self._post_form(
+                _EP_CUSTOMERS,
+                customer_params,
+                timeout=10.0
+            )
+            
+            if response.status_code != 200:
+                error_text = response.text
+                logger.error("Customer creation failed: %s", error_text)
+                raise StripeAPIError(f"Failed to create customer: {error_text}")
+            
+            customer_info = _parse_json(response)
+            logger.info("Created new customer: %s", customer_info['id'])
+            self._cache_customer(customer_data.email, customer_info)
+            
+            return _StripeCustomerView(customer_info)
+            
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error("Error in _get_or_create_customer: %s", e)
             raise
     
-    async def _create_payment_method(self, payment_method_data, customer_id: str):
+    def _get_cached_customer(self, email: str) -> Optional[Dict[str, Any]]:
+        """Return cached customer info for an email, dropping expired entries"""
+        entry = self._customer_cache.get(email)
+        if entry is None:
+            return None
+        cached_at, customer_info = entry
+        if time.monotonic() - cached_at > CUSTOMER_CACHE_TTL_SECONDS:
+            del self._customer_cache[email]
+            return None
+        self._customer_cache.move_to_end(email)
+        return customer_info
+    
+    def _cache_customer(self, email: str, customer_info: Dict[str, Any]):
+        """Cache customer info by email, evicting the oldest entry when full"""
+        self._customer_cache[email] = (time.monotonic(), customer_info)
+        self._customer_cache.move_to_end(email)
+        if len(self._customer_cache) > CUSTOMER_CACHE_MAX_SIZE:
+            self._customer_cache.popitem(last=False)
+    
+    async def _create_payment_method_detached(self, payment_method_data, order_id: str) -> _StripePaymentMethodView:
         """
-        Create a Stripe PaymentMethod
+        Create a Stripe PaymentMethod that is not yet attached to a customer
+        
+        The request is keyed on the order and card details, so a retried
+        checkout with the same card gets back the same PaymentMethod.
         
         Args:
             payment_method_data: Payment method information
-            customer_id: Customer ID to attach the payment method to
+            order_id: Order the PaymentMethod is created for
             
         Returns:
             Stripe PaymentMethod object
         """
         try:
-            # Map test card numbers to their corresponding test tokens
-            test_tokens = {
-                '4242424242424242': 'tok_visa',
-                '4000056655665556': 'tok_visa_debit',
-                '5555555555554444': 'tok_mastercard',
-                '2223003122003222': 'tok_mastercard_debit',
-                '5200828282828210': 'tok_mastercard_prepaid',
-                '5105105105105100': 'tok_mastercard',
-                '378282246310005': 'tok_amex',
-                '371449635398431': 'tok_amex',
-                '6011111111111117': 'tok_discover',
-                '3056930009020004': 'tok_diners',
-                '3566002020360505': 'tok_jcb',
-                '6200000000000005': 'tok_unionpay'
-            }
-            
             card_number = payment_method_data.card_number
+            test_token = STRIPE_TEST_TOKENS.get(card_number)
             
-            async with httpx.AsyncClient() as client:
-                if card_number in test_tokens:
-                    # Use test token for known test cards
-                    test_token = test_tokens[card_number]
-                    logger.info(f"Using test token {test_token} for card number {card_number}")
-                    
-                    payment_method_params = {
-                        'type': 'card',
-                        'card[token]': test_token,
-                        'billing_details[name]': payment_method_data.name_on_card,
-                        'billing_details[email]': payment_method_data.email if hasattr(payment_method_data, 'email') else 'test@example.com'
-                    }
-                else:
-                    # Use raw card data for other cards
-                    payment_method_params = {
-                        'type': 'card',
-                        'card[number]': card_number,
-                        'card[exp_month]': payment_method_data.expiry_month,
-                        'card[exp_year]': payment_method_data.expiry_year,
-                        'card[cvc]': payment_method_data.cvc,
-                        'billing_details[name]': payment_method_data.name_on_card,
-                        'billing_details[email]': payment_method_data.email if hasattr(payment_method_data, 'email') else 'test@example.com'
-                    }
-                
-                response = await client.post(
-                    "https://api.stripe.com/v1/payment_methods",
-                    data=payment_method_params,
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Stripe-Version": "2024-12-18.acacia"
-                    },
-                    timeout=30.0
-                )
+            if test_token is not None:
+                # Use test token for known test cards
+                logger.info("Using test token %s for card number %s", test_token, card_number)
                 
-                if response.status_code != 200:
-                    error_text = response.text
-                    logger.error(f"PaymentMethod creation failed: {error_text}")
-                    raise Exception(f"Failed to create payment method: {error_text}")
-                
-                payment_method_info = response.json()
-                logger.info(f"PaymentMethod created: {payment_method_info['id']}")
-                
-                # Attach payment method to customer
-                attach_response = await client.post(
-                    f"https://api.stripe.com/v1/payment_methods/{payment_method_info['id']}/attach",
-                    data={'customer': customer_id},
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Stripe-Version": "2024-12-18.acacia"
-                    },
-                    timeout=10.0
-                )
-                
-                if attach_response.status_code != 200:
-                    logger.warning(f"Failed to attach payment method to customer: {attach_response.text}")
-                
-                # Create mock payment method object
-                class MockPaymentMethod:
-                    def __init__(self, payment_method_data):
-                        self.id = payment_method_data['id']
-                        self.type = payment_method_data['type']
-                        self.card = payment_method_data.get('card')
-                        self.billing_details = payment_method_data.get('billing_details')
-                        self.created = payment_method_data['created']
-                        self.customer = payment_method_data.get('customer')
-                
-                return MockPaymentMethod(payment_method_info)
-                
-        except Exception as e:
-            logger.error(f"Error in _create_payment_method: {e}")
+                payment_method_params = {
+                    'type': 'card',
+                    'card[token]': test_token,
+                    'billing_details[name]': payment_method_data.name_on_card,
+                    'billing_details[email]': payment_method_data.email if hasattr(payment_method_data, 'email') else 'test@example.com'
+                }
+            else:
+                # Use raw card data for other cards
+                payment_method_params = {
+                    'type': 'card',
+                    'card[number]': card_number,
+                    'card[exp_month]': payment_method_data.expiry_month,
+                    'card[exp_year]': payment_method_data.expiry_year,
+                    'card[cvc]': payment_method_data.cvc,
+                    'billing_details[name]': payment_method_data.name_on_card,
+                    'billing_details[email]': payment_method_data.email if hasattr(payment_method_data, 'email') else 'test@example.com'
+                }
+            
+            response = await self._post_form(
+                _EP_PAYMENT_METHODS,
+                payment_method_params,
+                headers={"Idempotency-Key": _idempotency_key("pm", order_id, payment_method_params, secret=self.api_key)},
+                timeout=30.0
+            )
+            
+            if response.status_code != 200:
+                error_text = response.text
+                logger.error("PaymentMethod creation failed: %s", error_text)
+                raise StripeAPIError(f"Failed to create payment method: {error_text}")
+            
+            payment_method_info = _parse_json(response)
+            logger.info("PaymentMethod created: %s", payment_method_info['id'])
+            
+            return _StripePaymentMethodView(payment_method_info)
+            
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error("Error in _create_payment_method_detached: %s", e)
             raise
     
+    @staticmethod
+    def _is_payment_intent_missing(response: httpx.Response) -> bool:
+        """Whether a Stripe error response reports an unknown PaymentIntent"""
+        if response.status_code == 404:
+            return True
+        try:
+            error = _parse_json(response).get('error', {})
+        except ValueError:
+            return False
+        return error.get('code') == 'resource_missing' and error.get('param') == 'payment_intent'
+    
     def _create_error_response(
         self, 
         order_id: str, 
@@ -622,13 +752,17 @@ class StripeService:
             status="failed",
             message=message,
             error=message,
-            timestamp=datetime.utcnow()
+            timestamp=datetime.now(_UTC)
         )
     
     def verify_webhook_signature(self, payload: bytes, signature: str) -> bool:
         """
         Verify Stripe webhook signature
         
+        Checks the v1 HMAC-SHA256 signature and timestamp tolerance directly,
+        without parsing the payload into a stripe.Event. Without a webhook
+        secret nothing can be verified, so every webhook is rejected.
+        
         Args:
             payload: Raw webhook payload
             signature: Stripe signature header
@@ -638,25 +772,45 @@ class StripeService:
         """
         try:
             if not self.webhook_secret:
-                logger.warning("No webhook secret configured, skipping signature verification")
-                return True
-            
-            # Use Stripe's webhook signature verification
-            event = stripe.Webhook.construct_event(
-                payload, signature, self.webhook_secret
-            )
-            
-            logger.info(f"Webhook signature verified for event: {event.get('type')}")
+                logger.error("No webhook secret configured, rejecting webhook")
+                return False
+            
+            # Header format: t=<timestamp>,v1=<signature>[,v1=<signature>...]
+            timestamp = None
+            candidates = []
+            for item in signature.split(','):
+                key, _, value = item.strip().partition('=')
+                if key == 't':
+                    timestamp = value
+                elif key == 'v1':
+                    candidates.append(value)
+            
+            if timestamp is None or not candidates:
+                logger.error("Invalid webhook signature: malformed Stripe-Signature header")
+                return False
+            
+            if abs(time.time() - int(timestamp)) > WEBHOOK_TOLERANCE_SECONDS:
+                logger.error("Invalid webhook signature: timestamp outside the tolerance zone")
+                return False
+            
+            expected = hmac.new(
+                self.webhook_secret.encode(),
+                timestamp.encode() + b'.' + payload,
+                hashlib.sha256
+            ).hexdigest()
+            
+            if not any(hmac.compare_digest(expected, candidate) for candidate in candidates):
+                logger.error("Invalid webhook signature: no matching v1 signature")
+                return False
+            
+            logger.info("Webhook signature verified")
             return True
             
         except ValueError as e:
-            logger.error(f"Invalid webhook payload: {e}")
-            return False
-        except stripe.error.SignatureVerificationError as e:
-            logger.error(f"Invalid webhook signature: {e}")
+            logger.error("Invalid webhook signature header: %s", e)
             return False
         except Exception as e:
-            logger.error(f"Error verifying webhook signature: {e}")
+            logger.error("Error verifying webhook signature: %s", e)
             return False
     
     async def test_connection(self, api_key: str) -> Dict[str, Any]:
@@ -672,38 +826,35 @@ class StripeService:
         try:
             logger.info("Testing Stripe connection...")
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    "https://api.stripe.com/v1/account",
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Stripe-Version": "2024-12-18.acacia"
-                    },
-                    timeout=10.0
-                )
+            client = await get_http_client()
+            response = await client.get(
+                STRIPE_API_BASE + _EP_ACCOUNT,
+                headers={**self._auth_headers, "Authorization": f"Bearer {api_key}"},
+                timeout=10.0
+            )
+            
+            if response.status_code == 200:
+                account_data = _parse_json(response)
+                logger.info("Stripe connection successful for account: %s", account_data.get('id'))
+                return {
+                    "success": True,
+                    "message": "Stripe connection successful",
+                    "account_id": account_data.get('id'),
+                    "livemode": account_data.get('livemode', False),
+                    "timestamp": datetime.now(_UTC).isoformat(timespec="seconds")
+                }
+            else:
+                logger.error("Stripe connection failed: %s", response.text)
+                return {
+                    "success": False,
+                    "message": f"Stripe connection failed: {response.text}",
+                    "timestamp": datetime.now(_UTC).isoformat(timespec="seconds")
+                }
                 
-                if response.status_code == 200:
-                    account_data = response.json()
-                    logger.info(f"Stripe connection successful for account: {account_data.get('id')}")
-                    return {
-                        "success": True,
-                        "message": "Stripe connection successful",
-                        "account_id": account_data.get('id'),
-                        "livemode": account_data.get('livemode', False),
-                        "timestamp": datetime.utcnow().isoformat()
-                    }
-                else:
-                    logger.error(f"Stripe connection failed: {response.text}")
-                    return {
-                        "success": False,
-                        "message": f"Stripe connection failed: {response.text}",
-                        "timestamp": datetime.utcnow().isoformat()
-                    }
-                    
         except Exception as e:
-            logger.error(f"Error testing Stripe connection: {e}")
+            logger.error("Error testing Stripe connection: %s", e)
             return {
                 "success": False,
                 "message": f"Error testing connection: {str(e)}",
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": datetime.now(_UTC).isoformat(timespec="seconds")
             } 
\ No newline at end of file
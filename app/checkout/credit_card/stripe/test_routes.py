@@ -4,9 +4,8 @@ from typing import Dict, Any
 import logging
 
 from .services import StripeService
+from app.checkout.connection_test_cache import cached_test, credential_cache_key
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Create router for test connection
@@ -32,18 +31,16 @@ async def test_stripe_connection(
     It attempts to make a simple API call to verify the credentials are valid.
     """
     try:
-        # Debug: Print the entire request payload
-        print("=== STRIPE TEST CONNECTION DEBUG ===")
-        print(f"Request object: {request}")
-        print(f"Request dict: {request.dict()}")
-        print(f"API Key present: {bool(request.api_key)}")
-        print(f"API Key length: {len(request.api_key) if request.api_key else 0}")
-        print(f"API Key preview: {request.api_key[:10] + '...' if request.api_key else 'None'}")
-        print(f"Publishable Key present: {bool(request.publishable_key)}")
-        print(f"Environment: {request.environment}")
-        print("=====================================")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Stripe test request: env=%s, key_len=%d, key_preview=%s, pub_key_present=%s",
+                request.environment,
+                len(request.api_key or ""),
+                (request.api_key[:6] + "...") if request.api_key else "None",
+                bool(request.publishable_key)
+            )
         
-        logger.info(f"Testing Stripe connection for environment: {request.environment}")
+        logger.info("Testing Stripe connection for environment: %s", request.environment)
         
         # Validate request
         if not request.api_key:
@@ -53,11 +50,19 @@ async def test_stripe_connection(
                 detail="Stripe API key is required for connection test"
             )
         
-        # Create a temporary service instance for testing
-        test_service = StripeService(request.api_key)
+        async def run_test() -> Dict[str, Any]:
+            # Create a temporary service instance for testing
+            test_service = StripeService(request.api_key)
+            
+            # Test the connection
+            return await test_service.test_connection(request.api_key)
         
-        # Test the connection
-        result = await test_service.test_connection(request.api_key)
+        # Repeat clicks with the same key reuse the recent result
+        result = await cached_test(
+            credential_cache_key("stripe", request.environment, request.api_key),
+            run_test,
+            succeeded=lambda r: r.get("success")
+        )
         
         if result.get("success"):
             logger.info("Stripe connection test successful")
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+import httpx
+from tenacity import (
+    AsyncRetrying,
+    before_sleep_log,
+    retry_if_exception_type,
+    retry_if_result,
+    stop_after_attempt,
+    wait_exponential_jitter
+)
+
+logger = logging.getLogger(__name__)
+
+# Process-wide pooled client for outbound payment provider calls (Klarna, PayPal, Stripe).
+# Reusing keep-alive connections avoids a fresh TCP+TLS handshake per request, and
+# HTTP/2 lets concurrent requests to the same provider share one connection.
+# Idle connections are kept for a minute so sporadic checkouts still find one open.
+_client: Optional[httpx.AsyncClient] = None
+
+# Retry policy for transient provider failures: connection errors, timeouts and 5xx
+RETRY_ATTEMPTS = 3
+RETRY_INITIAL_WAIT_SECONDS = 0.2
+RETRY_MAX_WAIT_SECONDS = 2.0
+
+
+async def get_http_client() -> httpx.AsyncClient:
+    """Return the shared HTTP client, creating it on first use"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(30.0, connect=5.0, pool=10.0),
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=60.0)
+        )
+        logger.info("Shared HTTP client created")
+    return _client
+
+
+async def close_http_client():
+    """Close the shared HTTP client; a later call to get_http_client creates a new one"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("Shared HTTP client closed")
+
+
+# Failures that happen before any of the request reaches the provider
+_NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def _is_server_error(response: httpx.Response) -> bool:
+    return response.status_code >= 500
+
+
+def _never(response: httpx.Response) -> bool:
+    return False
+
+
+async def send_with_retry(
+    send: Callable[[], Awaitable[httpx.Response]],
+    limiter: Optional[asyncio.Semaphore] = None,
+    idempotent: bool = True
+) -> httpx.Response:
+    """
+    Send a request, retrying transport errors and 5xx responses with jittered backoff
+
+    4xx responses are returned immediately. When retries are exhausted the last
+    response is returned (or the last exception re-raised). If a limiter is given,
+    each attempt holds it only while the request is in flight, not while backing off.
+    Pass idempotent=False for requests that must not be repeated once the provider
+    may have received them (e.g. a POST without an idempotency key): only failures
+    to connect are retried then, never timeouts or 5xx responses.
+    """
+    async def attempt() -> httpx.Response:
+        if limiter is None:
+            return await send()
+        async with limiter:
+            return await send()
+
+    retrying = AsyncRetrying(
+        stop=stop_after_attempt(RETRY_ATTEMPTS),
+        wait=wait_exponential_jitter(initial=RETRY_INITIAL_WAIT_SECONDS, max=RETRY_MAX_WAIT_SECONDS, jitter=RETRY_INITIAL_WAIT_SECONDS),
+        retry=(
+            retry_if_exception_type(httpx.TransportError) | retry_if_result(_is_server_error)
+            if idempotent else
+            retry_if_exception_type(_NOT_SENT_ERRORS) | retry_if_result(_never)
+        ),
+        before_sleep=before_sleep_log(logger, logging.WARNING),
+        retry_error_callback=lambda retry_state: retry_state.outcome.result()
+    )
+    return await retrying(attempt)
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import ORJSONResponse
 from .test_routes import router as test_router
 from .services import KlarnaService, KlarnaSessionRequestSchema, KlarnaSessionResponseSchema
 
@@ -9,7 +10,7 @@ router = APIRouter(
 )
 router.include_router(test_router, prefix="")
 
-@router.post("/session", response_model=KlarnaSessionResponseSchema)
+@router.post("/session", response_model=KlarnaSessionResponseSchema, response_class=ORJSONResponse)
 async def create_klarna_session(request: KlarnaSessionRequestSchema):
     """
     Create a Klarna payment session for the frontend widget
@@ -19,7 +20,7 @@ async def create_klarna_session(request: KlarnaSessionRequestSchema):
         result = await klarna_service.create_session(request)
         if not result.success:
             raise HTTPException(status_code=400, detail=result.message)
-        return result
+        return ORJSONResponse(result.model_dump(mode="json"), headers={"Cache-Control": "no-store"})
     except HTTPException:
         raise
     except Exception as e:
@@ -1,12 +1,94 @@
 import logging
-import httpx
-import base64
+import asyncio
+import binascii
+import orjson
+from decimal import Decimal, ROUND_HALF_UP
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
+from app.checkout.http_client import get_http_client, send_with_retry
+from config import settings
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+KLARNA_USER_AGENT = "curl/7.79.1"  # Match cURL, which Klarna accepts
+
+# Caps concurrent requests to Klarna so checkout bursts queue here instead of hitting rate limits
+_KLARNA_SEM = asyncio.Semaphore(settings.KLARNA_MAX_CONCURRENCY)
+
+# Klarna API base URL per (region, environment)
+_KLARNA_HOSTS = {
+    ("Europe", "live"): "https://api.klarna.com",
+    ("Europe", "playground"): "https://api.playground.klarna.com",
+    ("Oceania", "live"): "https://api-oc.klarna.com",
+    ("Oceania", "playground"): "https://api-oc.playground.klarna.com",
+    ("North America", "live"): "https://api-na.klarna.com",
+    ("North America", "playground"): "https://api-na.playground.klarna.com",
+}
+
+def _resolve_api_base(region: Optional[str], environment: str) -> str:
+    """Klarna API base URL; unknown regions use North America, non-live environments the playground"""
+    env = "live" if environment == "live" else "playground"
+    return _KLARNA_HOSTS.get((region, env)) or _KLARNA_HOSTS[("North America", env)]
+
+# Fixed session payload used to probe Klarna credentials, encoded once
+_KLARNA_TEST_PAYLOAD = {
+    "purchase_country": "US",
+    "purchase_currency": "USD",
+    "locale": "en-US",
+    "order_amount": 10000,
+    "order_tax_amount": 1000,
+    "order_lines": [
+        {
+            "type": "physical",
+            "reference": "SKU123",
+            "name": "Blue T-Shirt",
+            "quantity": 1,
+            "unit_price": 10000,
+            "tax_rate": 1000,
+            "total_amount": 10000,
+            "total_tax_amount": 1000
+        }
+    ],
+    "billing_address": {
+        "given_name": "John",
+        "family_name": "Doe",
+        "email": "john@doe.com",
+        "street_address": "Lombard St 10",
+        "postal_code": "90210",
+        "city": "Beverly Hills",
+        "region": "CA",
+        "phone": "333444555",
+        "country": "US"
+    },
+    "customer": {
+        "type": "person",
+        "date_of_birth": "1995-10-20"
+    },
+    "merchant_urls": {
+        "confirmation": "https://www.example.com/confirmation",
+        "notification": "https://www.example.com/notification"
+    }
+}
+_KLARNA_TEST_PAYLOAD_BYTES = orjson.dumps(_KLARNA_TEST_PAYLOAD)
+
+def _to_minor_units(amount: Any) -> int:
+    """Convert a decimal money amount (float, str or Decimal) to whole cents, rounding half up"""
+    return int((Decimal(str(amount)) * 100).to_integral_value(ROUND_HALF_UP))
+
+def _basic_auth_header(username: str, password: str) -> str:
+    """Build a Basic Authorization header value from Klarna API credentials"""
+    encoded = binascii.b2a_base64(f"{username.strip()}:{password.strip()}".encode(), newline=False).decode("ascii")
+    return f"Basic {encoded}"
+
+def _request_headers(auth_header: str) -> Dict[str, str]:
+    """Headers sent with every Klarna API request"""
+    return {
+        "Content-Type": "application/json",
+        "Authorization": auth_header,
+        "User-Agent": KLARNA_USER_AGENT
+    }
+
 class KlarnaTestConnectionRequestSchema(BaseModel):
     username: Optional[str] = None
     password: Optional[str] = None
@@ -52,66 +134,22 @@ class KlarnaService:
         self.environment = environment
         self.region = region or "North America"
         self.authorization = authorization
-        # Determine API base URL based on region and environment
-        if self.region == "Europe":
-            self.api_base = "https://api.klarna.com" if environment == "live" else "https://api.playground.klarna.com"
-        elif self.region == "Oceania":
-            self.api_base = "https://api-oc.klarna.com" if environment == "live" else "https://api-oc.playground.klarna.com"
+        # Build the Authorization header once; username/password take precedence
+        if username and password:
+            self._auth_header = _basic_auth_header(username, password)
+        elif authorization:
+            self._auth_header = f"Basic {authorization}"
         else:
-            self.api_base = "https://api-na.klarna.com" if environment == "live" else "https://api-na.playground.klarna.com"
+            self._auth_header = None
+        self._default_headers = _request_headers(self._auth_header) if self._auth_header else None
+        # Determine API base URL based on region and environment
+        self.api_base = _resolve_api_base(self.region, environment)
 
     async def test_connection(self, request: KlarnaTestConnectionRequestSchema) -> KlarnaTestConnectionResponseSchema:
-        payload = {
-            "purchase_country": "US",
-            "purchase_currency": "USD",
-            "locale": "en-US",
-            "order_amount": 10000,
-            "order_tax_amount": 1000,
-            "order_lines": [
-                {
-                    "type": "physical",
-                    "reference": "SKU123",
-                    "name": "Blue T-Shirt",
-                    "quantity": 1,
-                    "unit_price": 10000,
-                    "tax_rate": 1000,
-                    "total_amount": 10000,
-                    "total_tax_amount": 1000
-                }
-            ],
-            "billing_address": {
-                "given_name": "John",
-                "family_name": "Doe",
-                "email": "john@doe.com",
-                "street_address": "Lombard St 10",
-                "postal_code": "90210",
-                "city": "Beverly Hills",
-                "region": "CA",
-                "phone": "333444555",
-                "country": "US"
-            },
-            "customer": {
-                "type": "person",
-                "date_of_birth": "1995-10-20"
-            },
-            "merchant_urls": {
-                "confirmation": "https://www.example.com/confirmation",
-                "notification": "https://www.example.com/notification"
-            }
-        }
-        headers = {
-            "Content-Type": "application/json",
-        }
         if request.authorization:
-            headers["Authorization"] = f"Basic {request.authorization}"
-            logger.info(f"Klarna outgoing Authorization: Basic {request.authorization[:6]}...{request.authorization[-6:]}")
+            auth_header = f"Basic {request.authorization}"
         elif request.username and request.password:
-            username = request.username.strip()
-            password = request.password.strip()
-            auth_str = f"{username}:{password}"
-            encoded = base64.b64encode(auth_str.encode()).decode()
-            headers["Authorization"] = f"Basic {encoded}"
-            logger.info(f"Klarna outgoing Authorization: Basic {encoded[:6]}...{encoded[-6:]}")
+            auth_header = _basic_auth_header(request.username, request.password)
         else:
             return KlarnaTestConnectionResponseSchema(
                 success=False,
@@ -119,28 +157,27 @@ class KlarnaService:
                 error="MISSING_CREDENTIALS",
                 details={}
             )
-        # Set User-Agent to match cURL
-        headers["User-Agent"] = "curl/7.79.1"
-        # Use region from request if provided
-        if hasattr(request, 'region') and request.region:
-            if request.region == "Europe":
-                self.api_base = "https://api.klarna.com" if request.environment == "live" else "https://api.playground.klarna.com"
-            elif request.region == "Oceania":
-                self.api_base = "https://api-oc.klarna.com" if request.environment == "live" else "https://api-oc.playground.klarna.com"
-            else:
-                self.api_base = "https://api-na.klarna.com" if request.environment == "live" else "https://api-na.playground.klarna.com"
+        encoded = auth_header[len("Basic "):]
+        logger.info(f"Klarna outgoing Authorization: Basic {encoded[:6]}...{encoded[-6:]}")
+        headers = _request_headers(auth_header)
+        # Use region from request if provided, without touching the service's own api_base
+        api_base = _resolve_api_base(request.region, request.environment) if request.region else self.api_base
         try:
-            logger.info(f"Klarna outgoing endpoint: {self.api_base}/payments/v1/sessions")
+            logger.info(f"Klarna outgoing endpoint: {api_base}/payments/v1/sessions")
             logger.info(f"Klarna outgoing headers: {{'Content-Type': 'application/json', 'Authorization': 'Basic ...', 'User-Agent': 'curl/7.79.1'}}")
-            logger.info(f"Klarna outgoing payload: {payload}")
-            async with httpx.AsyncClient(timeout=15.0) as client:
-                response = await client.post(
-                    f"{self.api_base}/payments/v1/sessions",
+            logger.debug("Klarna outgoing payload: %s", _KLARNA_TEST_PAYLOAD)
+            client = await get_http_client()
+            response = await send_with_retry(
+                lambda: client.post(
+                    f"{api_base}/payments/v1/sessions",
                     headers=headers,
-                    json=payload
-                )
-            logger.info(f"Klarna response status: {response.status_code}")
-            logger.info(f"Klarna response body: {response.text}")
+                    content=_KLARNA_TEST_PAYLOAD_BYTES,
+                    timeout=15.0
+                ),
+                limiter=_KLARNA_SEM
+            )
+            logger.info("Klarna response: status=%d bytes=%d", response.status_code, len(response.content))
+            logger.debug("Klarna response body (%s): %s", response.http_version, response.text)
             if response.status_code in (200, 201):
                 logger.info("Klarna connection test successful")
                 return KlarnaTestConnectionResponseSchema(
@@ -190,25 +227,30 @@ class KlarnaService:
 
     async def create_session(self, request: KlarnaSessionRequestSchema) -> KlarnaSessionResponseSchema:
         """Create a Klarna payment session for a real order"""
+        # Build order lines in one pass; amounts go through Decimal so e.g. 19.99
+        # is 1999 cents, not the 1998 that float truncation gives
+        order_lines = []
+        for item in request.items:
+            unit_price = Decimal(str(item["unit_price"]))
+            quantity = item["quantity"]
+            order_lines.append({
+                "type": "physical",
+                "reference": item.get("product_id"),
+                "name": item.get("name"),
+                "quantity": quantity,
+                "unit_price": _to_minor_units(unit_price),
+                "tax_rate": 0,  # TODO: Add real tax rate if available
+                "total_amount": _to_minor_units(unit_price * quantity),
+                "total_tax_amount": 0  # TODO: Add real tax if available
+            })
         # Build Klarna payload from order
         payload = {
             "purchase_country": request.shipping_address.get("country_code", "US"),
             "purchase_currency": request.currency,
             "locale": "en-US",  # TODO: Make dynamic if needed
-            "order_amount": int(request.total_amount * 100),
-            "order_tax_amount": int(request.tax_amount * 100),
-            "order_lines": [
-                {
-                    "type": "physical",
-                    "reference": item.get("product_id"),
-                    "name": item.get("name"),
-                    "quantity": item.get("quantity"),
-                    "unit_price": int(float(item.get("unit_price")) * 100),
-                    "tax_rate": 0,  # TODO: Add real tax rate if available
-                    "total_amount": int(float(item.get("unit_price")) * item.get("quantity") * 100),
-                    "total_tax_amount": 0  # TODO: Add real tax if available
-                } for item in request.items
-            ],
+            "order_amount": _to_minor_units(request.total_amount),
+            "order_tax_amount": _to_minor_units(request.tax_amount),
+            "order_lines": order_lines,
             "billing_address": request.billing_address or request.shipping_address,
             "customer": request.customer,
             "merchant_urls": request.merchant_urls or {
@@ -216,31 +258,34 @@ class KlarnaService:
                 "notification": "https://www.example.com/notification"
             }
         }
-        headers = {"Content-Type": "application/json"}
-        # Use credentials from payment_config or env
-        username = self.username
-        password = self.password
+        # Use credentials from payment_config when they differ from the service's own
+        headers = self._default_headers
         if request.payment_config:
-            username = request.payment_config.get("username", username)
-            password = request.payment_config.get("password", password)
-        if username and password:
-            auth_str = f"{username}:{password}"
-            encoded = base64.b64encode(auth_str.encode()).decode()
-            headers["Authorization"] = f"Basic {encoded}"
-        elif self.authorization:
-            headers["Authorization"] = f"Basic {self.authorization}"
-        else:
+            username = request.payment_config.get("username", self.username)
+            password = request.payment_config.get("password", self.password)
+            if username and password and (username, password) != (self.username, self.password):
+                headers = _request_headers(_basic_auth_header(username, password))
+        if headers is None:
             return KlarnaSessionResponseSchema(success=False, message="Missing Klarna credentials", error="MISSING_CREDENTIALS")
-        headers["User-Agent"] = "curl/7.79.1"
         try:
-            async with httpx.AsyncClient(timeout=15.0) as client:
-                response = await client.post(
+            body = orjson.dumps(payload)
+            client = await get_http_client()
+            response = await send_with_retry(
+                lambda: client.post(
                     f"{self.api_base}/payments/v1/sessions",
                     headers=headers,
-                    json=payload
-                )
+                    content=body,
+                    timeout=15.0
+                ),
+                limiter=_KLARNA_SEM,
+                # Klarna may already have created the session when a response is
+                # slow or fails, so only retry when the request never went out
+                idempotent=False
+            )
+            logger.info("Klarna response: status=%d bytes=%d", response.status_code, len(response.content))
+            logger.debug("Klarna response body (%s): %s", response.http_version, response.text)
             if response.status_code in (200, 201):
-                data = response.json()
+                data = orjson.loads(response.content)
                 return KlarnaSessionResponseSchema(
                     success=True,
                     session_id=data.get("session_id"),
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 import logging
 from .services import KlarnaService, KlarnaTestConnectionRequestSchema, KlarnaTestConnectionResponseSchema
+from app.checkout.connection_test_cache import cached_test, credential_cache_key
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,7 +31,20 @@ async def test_klarna_connection(request: KlarnaTestConnectionRequestSchema):
             environment=request.environment,
             authorization=request.authorization
         )
-        result = await klarna_service.test_connection(request)
+        # Repeat clicks with the same credentials reuse the recent result
+        cache_key = credential_cache_key(
+            "klarna",
+            request.environment,
+            request.region,
+            request.authorization,
+            request.username,
+            request.password
+        )
+        result = await cached_test(
+            cache_key,
+            lambda: klarna_service.test_connection(request),
+            succeeded=lambda r: r.success
+        )
         logger.info(f"Test connection result: {result.success}")
         if not result.success:
             logger.error(f"Test connection failed: {result.message}")
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Collects queued items and hands them to handler in batches
+
+    A batch is flushed once it holds max_size items or max_wait seconds after
+    its first item arrived, whichever comes first. Batches are handled one at
+    a time by a single consumer task.
+    """
+
+    # How long stop() waits for queued items to be handled before cancelling
+    DRAIN_TIMEOUT_SECONDS = 10.0
+
+    def __init__(self, handler: Callable[[List[Any]], Awaitable[Any]], max_size: int, max_wait: float):
+        self.handler = handler
+        self.max_size = max(1, max_size)
+        self.max_wait = max_wait
+        self._queue: Optional["asyncio.Queue[Any]"] = None
+        self._consumer: Optional["asyncio.Task[None]"] = None
+
+    def start(self):
+        """Start the consumer task on the running loop"""
+        self._queue = asyncio.Queue()
+        self._consumer = asyncio.create_task(self._run(self._queue))
+
+    async def stop(self):
+        """Handle what is already queued (up to DRAIN_TIMEOUT_SECONDS), then stop the consumer"""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), self.DRAIN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("Stopping micro-batcher with %d items still queued", self._queue.qsize())
+        self._consumer.cancel()
+        await asyncio.gather(self._consumer, return_exceptions=True)
+        self._queue = None
+        self._consumer = None
+
+    async def put(self, item: Any):
+        """Queue an item for the next batch"""
+        if self._queue is None:
+            raise RuntimeError("Micro-batcher is not running")
+        await self._queue.put(item)
+
+    async def _run(self, queue: "asyncio.Queue[Any]"):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_size:
+                # Take whatever is already queued without waiting
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self.handler(batch)
+            except Exception:
+                logger.exception("Micro-batch handler failed for %d items", len(batch))
+            finally:
+                for _ in batch:
+                    queue.task_done()
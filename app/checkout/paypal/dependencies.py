@@ -0,0 +1,29 @@
+from fastapi import HTTPException, Request
+from app.checkout.micro_batch import MicroBatcher
+from app.checkout.services import CheckoutService
+from app.checkout.paypal.services import PayPalCommerceService
+
+
+def _from_app_state(request: Request, name: str):
+    service = getattr(request.app.state, name, None)
+    if service is None:
+        raise HTTPException(
+            status_code=500,
+            detail="PayPal services not initialized. Please check application startup."
+        )
+    return service
+
+
+def get_checkout_service(request: Request) -> CheckoutService:
+    """Dependency to get the per-process checkout service built in the app lifespan"""
+    return _from_app_state(request, "checkout_service")
+
+
+def get_paypal_service(request: Request) -> PayPalCommerceService:
+    """Dependency to get the per-process PayPal connection-test service built in the app lifespan"""
+    return _from_app_state(request, "paypal_service")
+
+
+def get_webhook_batcher(request: Request) -> MicroBatcher:
+    """Dependency to get the PayPal webhook micro-batcher started in the app lifespan"""
+    return _from_app_state(request, "webhook_batcher")
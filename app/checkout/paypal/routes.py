@@ -1,17 +1,22 @@
-from fastapi import APIRouter, HTTPException, Request, BackgroundTasks
-from typing import Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse
+from typing import Dict, Any, List
 import logging
+import orjson
 from app.checkout.schemas import (
     CheckoutRequestSchema,
     CheckoutResponseSchema,
-    WebhookEventSchema
+    PayPalOrderStatusSchema
 )
-from app.checkout.services import CheckoutService
-from app.checkout.paypal.services import PayPalCommerceService
 from app.checkout.paypal.test_routes import router as test_router
+from app.checkout.task_queue import enqueue
+from app.checkout.webhook_dedup import first_delivery, forget_delivery
+from app.checkout.checkout_jobs import create_job, finish_job, get_job
+from app.checkout.services import CheckoutService, order_details_ttl
+from app.checkout.micro_batch import MicroBatcher
+from config import PAYPAL_ASYNC_CHECKOUT, PAYPAL_WEBHOOK_ID
+from app.checkout.paypal.dependencies import get_checkout_service, get_webhook_batcher
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter(
@@ -20,70 +25,169 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-# Initialize services
-checkout_service = CheckoutService()
-paypal_service = PayPalCommerceService()
+# PayPal webhook payloads are a few KB; much larger bodies are rejected
+MAX_WEBHOOK_BODY_BYTES = 1024 * 1024
 
-@router.post("/process-paypal", response_model=CheckoutResponseSchema)
+# Handlers below return ready-made ORJSONResponses from service-built schemas, so
+# response_model=None skips FastAPI's re-validation; responses= keeps the OpenAPI docs
+@router.post(
+    "/process-paypal",
+    response_model=None,
+    response_class=ORJSONResponse,
+    responses={200: {"model": CheckoutResponseSchema}, 202: {"model": CheckoutResponseSchema}}
+)
 async def process_paypal_checkout(
     request: CheckoutRequestSchema,
-    background_tasks: BackgroundTasks
-):
+    http_request: Request,
+    checkout_service: CheckoutService = Depends(get_checkout_service)
+) -> ORJSONResponse:
     """
     Process PayPal Commerce Platform checkout
+
+    With a "Prefer: respond-async" header, and PAYPAL_ASYNC_CHECKOUT enabled, the
+    order is created in the background: the response is 202 with an ack_token, and
+    the Location header points to the status endpoint to poll for the final result.
+    Otherwise the preference is ignored and the checkout is processed in the request.
     """
     try:
-        logger.info(f"Received raw checkout payload: {request.dict()}")
-        logger.info(f"Received PayPal checkout request for order: {request.order_id}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received raw checkout payload: %s", request.model_dump())
+        logger.info("Received PayPal checkout request for order: %s", request.order_id)
         if request.payment_method.lower() != "paypal":
             raise HTTPException(
                 status_code=400,
                 detail="Invalid payment method. Only PayPal is supported."
             )
+        if PAYPAL_ASYNC_CHECKOUT and "respond-async" in http_request.headers.get("prefer", "").lower():
+            pending = create_job(request.order_id)
+            await enqueue(run_checkout_job, checkout_service, pending.ack_token, request)
+            logger.info("PayPal checkout accepted for order %s: %s", request.order_id, pending.ack_token)
+            status_url = str(http_request.url_for("get_paypal_checkout_status", ack_token=pending.ack_token))
+            return ORJSONResponse(
+                pending.model_dump(mode="json"),
+                status_code=202,
+                headers={"Cache-Control": "no-store", "Location": status_url}
+            )
         response = await checkout_service.process_checkout(request, request.payment_config)
         if not response.success:
-            logger.error(f"Checkout failed for order {request.order_id}: {response.message}")
+            logger.error("Checkout failed for order %s: %s", request.order_id, response.message)
             raise HTTPException(
                 status_code=400,
                 detail=response.message
             )
-        logger.info(f"PayPal checkout processed successfully for order: {request.order_id}")
-        background_tasks.add_task(
+        logger.info("PayPal checkout processed successfully for order: %s", request.order_id)
+        await enqueue(
             log_order_processing,
             request.order_id,
             response.paypal_order_id,
             "checkout_processed"
         )
-        return response
+        return ORJSONResponse(response.model_dump(mode="json"), headers={"Cache-Control": "no-store"})
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Unexpected error in PayPal checkout: {str(e)}")
+        logger.error("Unexpected error in PayPal checkout: %s", e)
         raise HTTPException(
             status_code=500,
             detail="Internal server error during checkout processing"
         )
 
+@router.get(
+    "/checkout-status/{ack_token}",
+    response_model=None,
+    response_class=ORJSONResponse,
+    responses={200: {"model": CheckoutResponseSchema}, 202: {"model": CheckoutResponseSchema}}
+)
+async def get_paypal_checkout_status(ack_token: str) -> ORJSONResponse:
+    """
+    Poll a checkout accepted with "Prefer: respond-async"; 202 while still pending
+    """
+    response = get_job(ack_token)
+    if response is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Unknown or expired checkout"
+        )
+    return ORJSONResponse(
+        response.model_dump(mode="json"),
+        status_code=202 if response.status == "pending" else 200,
+        headers={"Cache-Control": "no-store"}
+    )
+
+@router.get(
+    "/order/{paypal_order_id}",
+    response_model=None,
+    response_class=ORJSONResponse,
+    responses={200: {"model": PayPalOrderStatusSchema}}
+)
+async def get_paypal_order_details(
+    paypal_order_id: str,
+    order_id: str = Query(..., description="Order identifier the PayPal order was created for"),
+    checkout_service: CheckoutService = Depends(get_checkout_service)
+) -> ORJSONResponse:
+    """
+    Get the status of a PayPal order; pollers may reuse the response briefly
+
+    The caller must also know the order_id the PayPal order was created for;
+    a mismatch is answered like an unknown order. Payer details are not returned.
+    """
+    details = await checkout_service.get_order_details(paypal_order_id)
+    purchase_units = (details or {}).get("purchase_units") or [{}]
+    if details is None or purchase_units[0].get("reference_id") != order_id:
+        raise HTTPException(
+            status_code=404,
+            detail="PayPal order not found"
+        )
+    order_status = PayPalOrderStatusSchema.model_construct(
+        paypal_order_id=paypal_order_id,
+        order_id=order_id,
+        status=details.get("status")
+    )
+    max_age = int(order_details_ttl(order_status.status))
+    return ORJSONResponse(order_status.model_dump(mode="json"), headers={"Cache-Control": f"private, max-age={max_age}"})
+
 @router.post("/webhook")
 async def paypal_webhook(
     request: Request,
-    background_tasks: BackgroundTasks
+    checkout_service: CheckoutService = Depends(get_checkout_service),
+    webhook_batcher: MicroBatcher = Depends(get_webhook_batcher)
 ):
     """
     Handle PayPal webhook events
     """
+    event_id = None
     try:
-        body = await request.body()
         headers = dict(request.headers)
-        logger.info(f"Received PayPal webhook: {headers.get('paypal-transmission-id')}")
-        webhook_data = await request.json()
-        background_tasks.add_task(
-            process_webhook_event,
-            webhook_data
-        )
+        logger.info("Received PayPal webhook: %s", headers.get("paypal-transmission-id"))
+        try:
+            content_length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+        if content_length > MAX_WEBHOOK_BODY_BYTES:
+            raise HTTPException(status_code=413, detail="Webhook payload too large")
+        # Read the body into one growing buffer, giving up as soon as it is too large
+        body = bytearray()
+        async for chunk in request.stream():
+            body += chunk
+            if len(body) > MAX_WEBHOOK_BODY_BYTES:
+                raise HTTPException(status_code=413, detail="Webhook payload too large")
+        webhook_data = orjson.loads(body)
+        if PAYPAL_WEBHOOK_ID and not await checkout_service.paypal_service.verify_webhook_signature(headers, webhook_data):
+            logger.warning("Rejecting PayPal webhook with invalid signature: %s", headers.get("paypal-transmission-id"))
+            raise HTTPException(status_code=400, detail="Invalid webhook signature")
+        event_id = webhook_data.get("id") or headers.get("paypal-transmission-id")
+        if event_id and not first_delivery(event_id):
+            logger.info("Ignoring duplicate PayPal webhook: %s", event_id)
+            return {"success": True, "duplicate": True}
+        await webhook_batcher.put(webhook_data)
         return {"success": True, "message": "Webhook received and processed"}
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error processing webhook: {str(e)}")
+        logger.error("Error processing webhook: %s", e)
+        if event_id:
+            # Let PayPal's retry of this event through
+            forget_delivery(event_id)
         raise HTTPException(
             status_code=500,
             detail="Internal server error while processing webhook"
@@ -94,17 +198,26 @@ router.include_router(test_router, prefix="")
 
 async def log_order_processing(order_id: str, paypal_order_id: str, status: str):
     try:
-        logger.info(f"Logging order processing: {order_id} -> {paypal_order_id} -> {status}")
+        logger.info("Logging order processing: %s -> %s -> %s", order_id, paypal_order_id, status)
     except Exception as e:
-        logger.error(f"Error logging order processing: {str(e)}")
+        logger.error("Error logging order processing: %s", e)
+
+async def run_checkout_job(checkout_service, ack_token: str, request: CheckoutRequestSchema):
+    response = await checkout_service.process_checkout(request, request.payment_config)
+    finish_job(ack_token, response)
+    if response.success:
+        await log_order_processing(request.order_id, response.paypal_order_id, "checkout_processed")
+    else:
+        logger.error("Checkout failed for order %s: %s", request.order_id, response.message)
 
-async def process_webhook_event(webhook_data: Dict[str, Any]):
+async def process_webhook_events(paypal_service, events: List[Dict[str, Any]]):
     try:
-        logger.info(f"Processing webhook event: {webhook_data.get('event_type')}")
-        success = await paypal_service.process_webhook(webhook_data)
-        if success:
-            logger.info("Webhook processed successfully")
+        logger.info("Processing %d webhook events", len(events))
+        results = await paypal_service.process_webhook_batch(events)
+        failed = results.count(False)
+        if failed:
+            logger.error("Webhook processing failed for %d of %d events", failed, len(events))
         else:
-            logger.error("Webhook processing failed")
+            logger.info("Webhook events processed successfully")
     except Exception as e:
-        logger.error(f"Error processing webhook event: {str(e)}") 
\ No newline at end of file
+        logger.error("Error processing webhook events: %s", e)
@@ -1,12 +1,13 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import Dict, Any
 import logging
 
+from app.checkout.connection_test_cache import credential_cache_key
+from app.checkout.single_flight import single_flight
 from app.checkout.paypal.services import PayPalCommerceService
+from app.checkout.paypal.dependencies import get_paypal_service
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Create router for test connection
@@ -22,21 +23,24 @@ class PayPalTestRequest(BaseModel):
     mode: str = "sandbox"
 
 @router.post("/test-connection")
-async def test_paypal_connection(request: PayPalTestRequest):
+async def test_paypal_connection(
+    request: PayPalTestRequest,
+    paypal_service: PayPalCommerceService = Depends(get_paypal_service)
+):
     """
     Test PayPal Commerce Platform connection with provided credentials
     """
     try:
-        logger.info(f"Testing PayPal connection for mode: {request.mode}")
+        logger.info("Testing PayPal connection for mode: %s", request.mode)
         
-        # Create a temporary service instance for testing
-        test_service = PayPalCommerceService()
-        
-        # Test the connection
-        result = await test_service.test_connection(
-            client_id=request.client_id,
-            client_secret=request.client_secret,
-            mode=request.mode
+        # Test the connection; identical clicks in flight share one PayPal call
+        result = await single_flight(
+            credential_cache_key("paypal", request.mode, request.client_id, request.client_secret),
+            lambda: paypal_service.test_connection(
+                client_id=request.client_id,
+                client_secret=request.client_secret,
+                mode=request.mode
+            )
         )
         
         if result["success"]:
@@ -47,7 +51,7 @@ async def test_paypal_connection(request: PayPalTestRequest):
                 "details": result.get("details", {})
             }
         else:
-            logger.error(f"PayPal connection test failed: {result.get('error', 'Unknown error')}")
+            logger.error("PayPal connection test failed: %s", result.get("error", "Unknown error"))
             return {
                 "success": False,
                 "message": result.get("error", "Connection test failed"),
@@ -55,7 +59,7 @@ async def test_paypal_connection(request: PayPalTestRequest):
             }
             
     except Exception as e:
-        logger.error(f"Error testing PayPal connection: {str(e)}")
+        logger.error("Error testing PayPal connection: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Internal server error: {str(e)}"
@@ -1,10 +1,34 @@
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, ConfigDict, Field, EmailStr, field_serializer, field_validator
 from typing import List, Optional, Dict, Any
-from decimal import Decimal
-from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from datetime import datetime, timezone
+from types import MappingProxyType
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+_CENT = Decimal("0.01")
+
+def _round_to_cents(value: Any) -> Any:
+    """
+    Round a request money amount to cents before validation
+
+    Frontend totals are often computed in floats and arrive as e.g.
+    19.990000000000002; they are rounded half-up rather than rejected by the
+    two-decimal-place limit. Anything that isn't a number is left for the
+    field's own validation to reject.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float, str, Decimal)):
+        return value
+    try:
+        return Decimal(str(value)).quantize(_CENT, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        return value
 
 class AddressSchema(BaseModel):
     """Address information for shipping/billing"""
+    model_config = ConfigDict(frozen=True)
+
     line1: str = Field(..., description="Street address line 1")
     line2: Optional[str] = Field(None, description="Street address line 2")
     city: str = Field(..., description="City")
@@ -14,6 +38,8 @@ class AddressSchema(BaseModel):
 
 class CustomerSchema(BaseModel):
     """Customer information"""
+    model_config = ConfigDict(frozen=True)
+
     email: EmailStr = Field(..., description="Customer email address")
     first_name: str = Field(..., description="Customer first name")
     last_name: str = Field(..., description="Customer last name")
@@ -21,53 +47,72 @@ class CustomerSchema(BaseModel):
 
 class OrderItemSchema(BaseModel):
     """Individual order item"""
+    model_config = ConfigDict(frozen=True)
+
     product_id: str = Field(..., description="Product identifier")
     name: str = Field(..., description="Product name")
     quantity: int = Field(..., gt=0, description="Quantity ordered")
-    unit_price: Decimal = Field(..., gt=0, description="Unit price")
+    unit_price: Decimal = Field(..., gt=0, max_digits=12, decimal_places=2, description="Unit price")
     currency: str = Field(default="USD", description="Currency code")
     description: Optional[str] = Field(None, description="Product description")
 
+    _round_unit_price = field_validator("unit_price", mode="before")(_round_to_cents)
+
 class CheckoutRequestSchema(BaseModel):
     """Complete checkout request from frontend"""
+    model_config = ConfigDict(frozen=True)
+
     order_id: str = Field(..., description="Unique order identifier")
     customer: CustomerSchema = Field(..., description="Customer information")
     items: List[OrderItemSchema] = Field(..., description="Order items")
     shipping_address: AddressSchema = Field(..., description="Shipping address")
     billing_address: Optional[AddressSchema] = Field(None, description="Billing address (optional, uses shipping if not provided)")
-    subtotal: Decimal = Field(..., gt=0, description="Order subtotal")
-    tax_amount: Decimal = Field(default=0, ge=0, description="Tax amount")
-    shipping_amount: Decimal = Field(default=0, ge=0, description="Shipping cost")
-    discount_amount: Decimal = Field(default=0, ge=0, description="Discount amount")
-    total_amount: Decimal = Field(..., gt=0, description="Total order amount")
+    subtotal: Decimal = Field(..., gt=0, max_digits=12, decimal_places=2, description="Order subtotal")
+    tax_amount: Decimal = Field(default=0, ge=0, max_digits=12, decimal_places=2, description="Tax amount")
+    shipping_amount: Decimal = Field(default=0, ge=0, max_digits=12, decimal_places=2, description="Shipping cost")
+    discount_amount: Decimal = Field(default=0, ge=0, max_digits=12, decimal_places=2, description="Discount amount")
+    total_amount: Decimal = Field(..., gt=0, max_digits=12, decimal_places=2, description="Total order amount")
     currency: str = Field(default="USD", description="Currency code")
     payment_method: str = Field(default="paypal", description="Payment method")
     notes: Optional[str] = Field(None, description="Order notes")
     payment_config: Optional[Dict[str, Any]] = Field(None, description="Payment gateway configuration (credentials, mode, etc.)")
 
+    _round_amounts = field_validator(
+        "subtotal", "tax_amount", "shipping_amount", "discount_amount", "total_amount", mode="before"
+    )(_round_to_cents)
+
+# Read-only template for PayPalOrderSchema.application_context; each order gets a copy
+_DEFAULT_APPLICATION_CONTEXT = MappingProxyType({
+    "return_url": "http://localhost:3000/checkout/success",
+    "cancel_url": "http://localhost:3000/checkout/cancel",
+    "brand_name": "Your Store Name",
+    "landing_page": "LOGIN",
+    "user_action": "PAY_NOW",
+    "shipping_preference": "SET_PROVIDED_ADDRESS"
+})
+
 class PayPalOrderSchema(BaseModel):
     """PayPal order creation request"""
+    model_config = ConfigDict(frozen=True)
+
     intent: str = Field(default="CAPTURE", description="Payment intent")
     application_context: Dict[str, Any] = Field(
-        default_factory=lambda: {
-            "return_url": "http://localhost:3000/checkout/success",
-            "cancel_url": "http://localhost:3000/checkout/cancel",
-            "brand_name": "Your Store Name",
-            "landing_page": "LOGIN",
-            "user_action": "PAY_NOW",
-            "shipping_preference": "SET_PROVIDED_ADDRESS"
-        },
+        default_factory=_DEFAULT_APPLICATION_CONTEXT.copy,
         description="PayPal application context"
     )
     purchase_units: List[Dict[str, Any]] = Field(..., description="Purchase units")
 
 class PayPalPaymentSchema(BaseModel):
     """PayPal payment capture request"""
+    model_config = ConfigDict(frozen=True)
+
     payment_id: str = Field(..., description="PayPal payment ID")
     order_id: str = Field(..., description="Your order ID")
 
 class CheckoutResponseSchema(BaseModel):
     """Checkout response to frontend"""
+    model_config = ConfigDict(frozen=True)
+
     success: bool = Field(..., description="Operation success status")
     order_id: str = Field(..., description="Order identifier")
     paypal_order_id: Optional[str] = Field(None, description="PayPal order ID")
@@ -76,10 +121,17 @@ class CheckoutResponseSchema(BaseModel):
     redirect_url: Optional[str] = Field(None, description="PayPal redirect URL (if needed)")
     message: str = Field(..., description="Response message")
     error_code: Optional[str] = Field(None, description="Error code if failed")
-    timestamp: datetime = Field(default_factory=datetime.utcnow, description="Response timestamp")
+    ack_token: Optional[str] = Field(None, description="Token for polling a checkout accepted for asynchronous processing")
+    timestamp: datetime = Field(default_factory=_utc_now, description="Response timestamp")
+
+    @field_serializer("timestamp")
+    def _serialize_timestamp(self, timestamp: datetime) -> str:
+        return timestamp.isoformat(timespec="milliseconds")
 
 class PaymentCaptureResponseSchema(BaseModel):
     """Payment capture response"""
+    model_config = ConfigDict(frozen=True)
+
     success: bool = Field(..., description="Capture success status")
     payment_id: str = Field(..., description="PayPal payment ID")
     capture_id: Optional[str] = Field(None, description="PayPal capture ID")
@@ -87,10 +139,24 @@ class PaymentCaptureResponseSchema(BaseModel):
     amount: Optional[Decimal] = Field(None, description="Captured amount")
     currency: Optional[str] = Field(None, description="Currency code")
     message: str = Field(..., description="Response message")
-    timestamp: datetime = Field(default_factory=datetime.utcnow, description="Response timestamp")
+    timestamp: datetime = Field(default_factory=_utc_now, description="Response timestamp")
+
+    @field_serializer("timestamp")
+    def _serialize_timestamp(self, timestamp: datetime) -> str:
+        return timestamp.isoformat(timespec="milliseconds")
+
+class PayPalOrderStatusSchema(BaseModel):
+    """Status of a PayPal order, for pollers; no payer details"""
+    model_config = ConfigDict(frozen=True)
+
+    paypal_order_id: str = Field(..., description="PayPal order ID")
+    order_id: str = Field(..., description="Order identifier")
+    status: str = Field(..., description="PayPal order status")
 
 class WebhookEventSchema(BaseModel):
     """PayPal webhook event"""
+    model_config = ConfigDict(frozen=True)
+
     id: str = Field(..., description="Webhook event ID")
     event_type: str = Field(..., description="Event type")
     resource_type: str = Field(..., description="Resource type")
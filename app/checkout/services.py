@@ -1,89 +1,189 @@
-import os
-import json
 import logging
-from typing import Dict, Any, Optional, List
+import asyncio
+import functools
+import time
+import uuid
+from typing import Dict, Any, Optional, List, Tuple
+from collections import OrderedDict
 from decimal import Decimal
-import httpx
-from datetime import datetime, timedelta
-import paypalrestsdk
+import orjson
 from .schemas import (
     CheckoutRequestSchema, 
     CheckoutResponseSchema, 
-    PayPalOrderSchema,
-    PaymentCaptureResponseSchema,
-    WebhookEventSchema
+    PaymentCaptureResponseSchema
 )
-from config import settings
+from config import settings, PAYPAL_CLIENT_ID, PAYPAL_CLIENT_SECRET, PAYPAL_MODE, PAYPAL_WEBHOOK_ID, PAYPAL_MAX_CONCURRENCY, FRONTEND_URL
+from app.checkout.http_client import get_http_client, send_with_retry
+from app.checkout.single_flight import single_flight
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Brand shown to the buyer on PayPal's checkout pages
+PAYPAL_BRAND_NAME = "Your Store Name"
+
+# Caps concurrent requests to PayPal from this process (checkout, capture, lookups,
+# webhook verification and connection tests), so bursts queue here instead of
+# running into PayPal's rate limits
+PAYPAL_LIMITER = asyncio.Semaphore(PAYPAL_MAX_CONCURRENCY)
+
+# Headers shared by the PayPal order calls; only Authorization varies per call
+_ORDER_WRITE_HEADERS = {"Content-Type": "application/json", "Prefer": "return=representation"}
+_ORDER_READ_HEADERS = {"Content-Type": "application/json"}
+
+# Refresh OAuth tokens this long before they expire so none lapses mid-request
+TOKEN_EXPIRY_MARGIN_SECONDS = 300
+# Start a background refresh this long before then, so requests keep using the
+# current token instead of waiting on the OAuth round trip
+TOKEN_REFRESH_AHEAD_SECONDS = 600
+
+# Recent PayPal order lookups, least recently used first:
+# (client_id, mode, paypal_order_id) -> (expires_at, details).
+# Orders in a final status change no more, so they are kept much longer.
+ORDER_DETAILS_TTL_SECONDS = 5.0
+ORDER_DETAILS_FINAL_TTL_SECONDS = 300.0
+ORDER_DETAILS_FINAL_STATUSES = frozenset({"COMPLETED", "VOIDED"})
+ORDER_DETAILS_CACHE_SIZE = 10_000
+_ORDER_DETAILS_CACHE: "OrderedDict[Tuple[str, str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+def order_details_ttl(status: Optional[str]) -> float:
+    """How long details of a PayPal order in this status may be reused"""
+    return ORDER_DETAILS_FINAL_TTL_SECONDS if status in ORDER_DETAILS_FINAL_STATUSES else ORDER_DETAILS_TTL_SECONDS
+
+async def _on_capture_completed(resource: Dict[str, Any]):
+    # Payment was successfully captured
+    capture_id = resource.get("id")
+    status = resource.get("status")
+    amount = resource.get("amount", {})
+    
+    logger.info("Payment capture completed: %s, Status: %s, Amount: %s %s", capture_id, status, amount.get('value'), amount.get('currency_code'))
+    
+    # Here you would update your database with the payment status
+    # await update_order_payment_status(capture_id, status)
+
+async def _on_capture_denied(resource: Dict[str, Any]):
+    # Payment was denied
+    capture_id = resource.get("id")
+    logger.warning("Payment capture denied: %s", capture_id)
+    
+    # Here you would update your database with the failed status
+    # await update_order_payment_status(capture_id, "denied")
+
+async def _on_order_approved(resource: Dict[str, Any]):
+    # Order was approved by customer
+    order_id = resource.get("id")
+    logger.info("Order approved: %s", order_id)
+    
+    # Here you would update your database with the approved status
+    # await update_order_status(order_id, "approved")
+
+# Webhook event type -> handler for its resource; other event types are acknowledged and skipped
+_WEBHOOK_HANDLERS = {
+    "PAYMENT.CAPTURE.COMPLETED": _on_capture_completed,
+    "PAYMENT.CAPTURE.DENIED": _on_capture_denied,
+    "CHECKOUT.ORDER.APPROVED": _on_order_approved,
+}
+
+# Most PayPal accounts (distinct payment_config credentials) a CheckoutService keeps services for
+PAYPAL_ACCOUNT_SERVICES_SIZE = 256
+# Most recent PayPal orders a CheckoutService remembers the creating account of
+PAYPAL_ORDER_ACCOUNTS_SIZE = 10_000
+
+def _log_background_refresh_failure(task: "asyncio.Task[str]"):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Background PayPal token refresh failed: %s", task.exception())
+
+def _to_cents(amount) -> int:
+    """Whole cents in a money amount; request schemas allow at most two decimal places"""
+    return int(amount * 100)
+
+# Response schemas below are built with model_construct: every field is set here
+# from already-validated requests or PayPal responses, so re-validation is skipped
 class PayPalCommerceService:
     """PayPal Commerce Platform integration service"""
     
     def __init__(self, client_id: str = None, client_secret: str = None, mode: str = None):
         # Use provided credentials or fall back to environment variables
-        self.client_id = client_id or settings.PAYPAL_CLIENT_ID
-        self.client_secret = client_secret or settings.PAYPAL_CLIENT_SECRET
-        self.mode = mode or settings.PAYPAL_MODE
-        self.base_url = "https://api-m.sandbox.paypal.com" if self.mode == "sandbox" else "https://api-m.paypal.com"
+        self.client_id = client_id or PAYPAL_CLIENT_ID
+        self.client_secret = client_secret or PAYPAL_CLIENT_SECRET
+        self.mode = mode or PAYPAL_MODE
+        self.base_url = settings.paypal_base_url(self.mode)
         
         # Validate configuration
         if not self.client_id or not self.client_secret:
             logger.warning("PayPal configuration is incomplete. Credentials must be provided or set in environment variables.")
         
-        # Initialize PayPal SDK with current credentials
-        if self.client_id and self.client_secret:
-            paypalrestsdk.configure({
-                "mode": self.mode,
-                "client_id": self.client_id,
-                "client_secret": self.client_secret
-            })
+        # Redirect settings sent with every order; they only depend on settings
+        self._application_context = {
+            "return_url": f"{FRONTEND_URL}/checkout/success",
+            "cancel_url": f"{FRONTEND_URL}/checkout/cancel",
+            "brand_name": PAYPAL_BRAND_NAME,
+            "landing_page": "LOGIN",
+            "user_action": "PAY_NOW",
+            "shipping_preference": "SET_PROVIDED_ADDRESS"
+        }
         
-        self.access_token = None
-        self.token_expires_at = None
+        # Cached OAuth token, the monotonic time it stops being reused and when to start replacing it
+        self._token = None
+        self._token_expiry = 0.0
+        self._token_refresh_at = 0.0
+        # In-flight token request shared by every caller that finds the token expired
+        self._refresh_task: Optional["asyncio.Task[str]"] = None
+        # (token, write headers, read headers) for the last token order calls were made with
+        self._order_headers_cache: Optional[Tuple[str, Dict[str, str], Dict[str, str]]] = None
     
-    def update_credentials(self, client_id: str, client_secret: str, mode: str = None):
-        """Update credentials dynamically"""
-        self.client_id = client_id
-        self.client_secret = client_secret
-        self.mode = mode or self.mode
-        self.base_url = "https://api-m.sandbox.paypal.com" if self.mode == "sandbox" else "https://api-m.paypal.com"
-        
-        # Reconfigure PayPal SDK with new credentials
-        paypalrestsdk.configure({
-            "mode": self.mode,
-            "client_id": self.client_id,
-            "client_secret": self.client_secret
-        })
-        
-        # Reset access token cache
-        self.access_token = None
-        self.token_expires_at = None
+    def _order_headers(self, access_token: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """Write and read headers for order calls authorized by access_token, built once per token"""
+        cached = self._order_headers_cache
+        if cached is None or cached[0] != access_token:
+            authorization = f"Bearer {access_token}"
+            cached = self._order_headers_cache = (
+                access_token,
+                {**_ORDER_WRITE_HEADERS, "Authorization": authorization},
+                {**_ORDER_READ_HEADERS, "Authorization": authorization}
+            )
+        return cached[1], cached[2]
     
     async def _get_access_token(self) -> str:
         """Get PayPal access token with caching"""
-        if self.access_token and self.token_expires_at and datetime.utcnow() < self.token_expires_at:
-            return self.access_token
+        now = time.monotonic()
+        if self._token and now < self._token_refresh_at:
+            return self._token
+        
+        if self._token and now < self._token_expiry:
+            # Still valid: refresh in the background and keep using it meanwhile
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self._refresh_access_token())
+                self._refresh_task.add_done_callback(_log_background_refresh_failure)
+            return self._token
         
-        async with httpx.AsyncClient() as client:
+        # Join the refresh already in flight, if any, instead of starting another
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_access_token())
+        # Shielded so a cancelled caller does not cancel the refresh for the others
+        return await asyncio.shield(self._refresh_task)
+    
+    async def _refresh_access_token(self) -> str:
+        client = await get_http_client()
+        async with PAYPAL_LIMITER:
             auth_response = await client.post(
                 f"{self.base_url}/v1/oauth2/token",
                 auth=(self.client_id, self.client_secret),
                 headers={"Content-Type": "application/x-www-form-urlencoded"},
                 data={"grant_type": "client_credentials"}
             )
-            
-            if auth_response.status_code != 200:
-                raise Exception(f"Failed to get PayPal access token: {auth_response.text}")
-            
-            token_data = auth_response.json()
-            self.access_token = token_data["access_token"]
-            # Set expiration to 1 hour from now (with 5 minute buffer)
-            self.token_expires_at = datetime.utcnow() + timedelta(minutes=55)
-            
-            return self.access_token
+        
+        if auth_response.status_code != 200:
+            raise Exception(f"Failed to get PayPal access token: {auth_response.text}")
+        
+        token_data = orjson.loads(auth_response.content)
+        self._token = token_data["access_token"]
+        # Stop reusing the token a few minutes before PayPal's reported expiry
+        lifetime = token_data.get("expires_in", 3600) - TOKEN_EXPIRY_MARGIN_SECONDS
+        self._token_expiry = time.monotonic() + lifetime
+        # Short-lived tokens are refreshed half way through instead
+        self._token_refresh_at = self._token_expiry - min(TOKEN_REFRESH_AHEAD_SECONDS, lifetime / 2)
+        
+        return self._token
     
     def _format_address(self, address) -> Dict[str, str]:
         """Format address for PayPal API"""
@@ -98,9 +198,8 @@ class PayPalCommerceService:
     
     def _format_items(self, items: List) -> List[Dict[str, Any]]:
         """Format order items for PayPal API"""
-        formatted_items = []
-        for item in items:
-            formatted_items.append({
+        return [
+            {
                 "name": item.name,
                 "description": item.description or item.name,
                 "quantity": str(item.quantity),
@@ -108,265 +207,287 @@ class PayPalCommerceService:
                     "currency_code": item.currency,
                     "value": str(item.unit_price)
                 }
-            })
-        return formatted_items
+            }
+            for item in items
+        ]
+    
+    def _build_order_data(self, checkout_request: CheckoutRequestSchema) -> Dict[str, Any]:
+        """Build the PayPal create-order payload for a checkout"""
+        # Prepare purchase unit
+        purchase_unit = {
+            "reference_id": checkout_request.order_id,
+            "description": f"Order {checkout_request.order_id}",
+            "custom_id": checkout_request.order_id,
+            "amount": {
+                "currency_code": checkout_request.currency,
+                "value": str(checkout_request.total_amount),
+                "breakdown": {
+                    "item_total": {
+                        "currency_code": checkout_request.currency,
+                        "value": str(checkout_request.subtotal)
+                    },
+                    "tax_total": {
+                        "currency_code": checkout_request.currency,
+                        "value": str(checkout_request.tax_amount)
+                    },
+                    "shipping": {
+                        "currency_code": checkout_request.currency,
+                        "value": str(checkout_request.shipping_amount)
+                    },
+                    "discount": {
+                        "currency_code": checkout_request.currency,
+                        "value": str(checkout_request.discount_amount)
+                    }
+                }
+            },
+            "items": self._format_items(checkout_request.items),
+            "shipping": {
+                "name": {
+                    "full_name": f"{checkout_request.customer.first_name} {checkout_request.customer.last_name}"
+                },
+                "address": self._format_address(checkout_request.shipping_address)
+            }
+        }
+        
+        # Prepare order data
+        order_data = {
+            "intent": "CAPTURE",
+            "application_context": self._application_context,
+            "purchase_units": [purchase_unit]
+        }
+        
+        return order_data
     
     async def create_paypal_order(self, checkout_request: CheckoutRequestSchema) -> CheckoutResponseSchema:
         """Create PayPal order for checkout"""
         try:
-            logger.info(f"Creating PayPal order for order_id: {checkout_request.order_id}")
+            logger.info("Creating PayPal order for order_id: %s", checkout_request.order_id)
             
             # Validate configuration
             if not self.client_id or not self.client_secret:
-                return CheckoutResponseSchema(
+                return CheckoutResponseSchema.model_construct(
                     success=False,
                     order_id=checkout_request.order_id,
                     status="failed",
                     message="PayPal configuration is incomplete. Please configure PayPal credentials in admin settings.",
-                    error_code="CONFIG_ERROR",
-                    timestamp=datetime.utcnow()
+                    error_code="CONFIG_ERROR"
                 )
             
-            # Get access token
+            # A cached token is returned without suspending, so no task is needed
+            order_data = self._build_order_data(checkout_request)
             access_token = await self._get_access_token()
-            
-            # Prepare purchase unit
-            purchase_unit = {
-                "reference_id": checkout_request.order_id,
-                "description": f"Order {checkout_request.order_id}",
-                "custom_id": checkout_request.order_id,
-                "amount": {
-                    "currency_code": checkout_request.currency,
-                    "value": str(checkout_request.total_amount),
-                    "breakdown": {
-                        "item_total": {
-                            "currency_code": checkout_request.currency,
-                            "value": str(checkout_request.subtotal)
-                        },
-                        "tax_total": {
-                            "currency_code": checkout_request.currency,
-                            "value": str(checkout_request.tax_amount)
-                        },
-                        "shipping": {
-                            "currency_code": checkout_request.currency,
-                            "value": str(checkout_request.shipping_amount)
-                        },
-                        "discount": {
-                            "currency_code": checkout_request.currency,
-                            "value": str(checkout_request.discount_amount)
-                        }
-                    }
-                },
-                "items": self._format_items(checkout_request.items),
-                "shipping": {
-                    "name": {
-                        "full_name": f"{checkout_request.customer.first_name} {checkout_request.customer.last_name}"
-                    },
-                    "address": self._format_address(checkout_request.shipping_address)
-                }
-            }
-            
-            # Prepare order data
-            order_data = {
-                "intent": "CAPTURE",
-                "application_context": {
-                    "return_url": f"{settings.FRONTEND_URL}/checkout/success",
-                    "cancel_url": f"{settings.FRONTEND_URL}/checkout/cancel",
-                    "brand_name": "Your Store Name",
-                    "landing_page": "LOGIN",
-                    "user_action": "PAY_NOW",
-                    "shipping_preference": "SET_PROVIDED_ADDRESS"
-                },
-                "purchase_units": [purchase_unit]
-            }
+            write_headers, _ = self._order_headers(access_token)
             
             # Create order via PayPal API
-            async with httpx.AsyncClient() as client:
+            client = await get_http_client()
+            async with PAYPAL_LIMITER:
                 response = await client.post(
                     f"{self.base_url}/v2/checkout/orders",
-                    headers={
-                        "Authorization": f"Bearer {access_token}",
-                        "Content-Type": "application/json",
-                        "Prefer": "return=representation"
-                    },
-                    json=order_data
+                    headers=write_headers,
+                    content=orjson.dumps(order_data)
                 )
-                
-                if response.status_code != 201:
-                    error_data = response.json()
-                    logger.error(f"PayPal order creation failed: {error_data}")
-                    return CheckoutResponseSchema(
-                        success=False,
-                        order_id=checkout_request.order_id,
-                        status="failed",
-                        message=f"PayPal order creation failed: {error_data.get('message', 'Unknown error')}",
-                        error_code=error_data.get('error', 'PAYPAL_ERROR'),
-                        timestamp=datetime.utcnow()
-                    )
-                
-                order_response = response.json()
-                paypal_order_id = order_response["id"]
-                
-                logger.info(f"PayPal order created successfully: {paypal_order_id}")
-                
-                return CheckoutResponseSchema(
-                    success=True,
+            
+            if response.status_code != 201:
+                error_data = orjson.loads(response.content)
+                logger.error("PayPal order creation failed: %s", error_data)
+                return CheckoutResponseSchema.model_construct(
+                    success=False,
                     order_id=checkout_request.order_id,
-                    paypal_order_id=paypal_order_id,
-                    status="created",
-                    message="PayPal order created successfully",
-                    timestamp=datetime.utcnow()
+                    status="failed",
+                    message=f"PayPal order creation failed: {error_data.get('message', 'Unknown error')}",
+                    error_code=error_data.get('error', 'PAYPAL_ERROR')
                 )
-                
+            
+            order_response = orjson.loads(response.content)
+            paypal_order_id = order_response["id"]
+            
+            logger.info("PayPal order created successfully: %s", paypal_order_id)
+            
+            return CheckoutResponseSchema.model_construct(
+                success=True,
+                order_id=checkout_request.order_id,
+                paypal_order_id=paypal_order_id,
+                status="created",
+                message="PayPal order created successfully"
+            )
+            
         except Exception as e:
-            logger.error(f"Error creating PayPal order: {str(e)}")
-            return CheckoutResponseSchema(
+            logger.error("Error creating PayPal order: %s", e)
+            return CheckoutResponseSchema.model_construct(
                 success=False,
                 order_id=checkout_request.order_id,
                 status="error",
                 message=f"Error creating PayPal order: {str(e)}",
-                error_code="INTERNAL_ERROR",
-                timestamp=datetime.utcnow()
+                error_code="INTERNAL_ERROR"
             )
     
     async def capture_payment(self, paypal_order_id: str, order_id: str) -> PaymentCaptureResponseSchema:
         """Capture PayPal payment"""
         try:
-            logger.info(f"Capturing payment for PayPal order: {paypal_order_id}")
+            logger.info("Capturing payment for PayPal order: %s", paypal_order_id)
             
             # Validate configuration
             if not self.client_id or not self.client_secret:
-                return PaymentCaptureResponseSchema(
+                return PaymentCaptureResponseSchema.model_construct(
                     success=False,
                     payment_id=paypal_order_id,
                     status="failed",
-                    message="PayPal configuration is incomplete. Please configure PayPal credentials in admin settings.",
-                    timestamp=datetime.utcnow()
+                    message="PayPal configuration is incomplete. Please configure PayPal credentials in admin settings."
                 )
             
             # Get access token
             access_token = await self._get_access_token()
+            write_headers, _ = self._order_headers(access_token)
             
-            # Capture payment via PayPal API
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/v2/checkout/orders/{paypal_order_id}/capture",
-                    headers={
-                        "Authorization": f"Bearer {access_token}",
-                        "Content-Type": "application/json",
-                        "Prefer": "return=representation"
-                    }
-                )
-                
-                if response.status_code != 201:
-                    error_data = response.json()
-                    logger.error(f"PayPal payment capture failed: {error_data}")
-                    return PaymentCaptureResponseSchema(
-                        success=False,
-                        payment_id=paypal_order_id,
-                        status="failed",
-                        message=f"Payment capture failed: {error_data.get('message', 'Unknown error')}",
-                        timestamp=datetime.utcnow()
-                    )
-                
-                capture_response = response.json()
-                capture_id = capture_response["purchase_units"][0]["payments"]["captures"][0]["id"]
-                capture_status = capture_response["status"]
-                captured_amount = Decimal(capture_response["purchase_units"][0]["payments"]["captures"][0]["amount"]["value"])
-                currency = capture_response["purchase_units"][0]["payments"]["captures"][0]["amount"]["currency_code"]
-                
-                logger.info(f"Payment captured successfully: {capture_id}")
-                
-                return PaymentCaptureResponseSchema(
-                    success=True,
+            # Capture payment via PayPal API. PayPal-Request-Id makes the capture
+            # idempotent, so a retry after a dropped connection cannot capture twice;
+            # a replayed capture may come back as 200 instead of 201.
+            client = await get_http_client()
+            headers = {
+                **write_headers,
+                "PayPal-Request-Id": uuid.uuid4().hex
+            }
+            response = await send_with_retry(functools.partial(
+                client.post,
+                f"{self.base_url}/v2/checkout/orders/{paypal_order_id}/capture",
+                headers=headers
+            ), limiter=PAYPAL_LIMITER)
+            
+            if response.status_code not in (200, 201):
+                error_data = orjson.loads(response.content)
+                logger.error("PayPal payment capture failed: %s", error_data)
+                return PaymentCaptureResponseSchema.model_construct(
+                    success=False,
                     payment_id=paypal_order_id,
-                    capture_id=capture_id,
-                    status=capture_status,
-                    amount=captured_amount,
-                    currency=currency,
-                    message="Payment captured successfully",
-                    timestamp=datetime.utcnow()
+                    status="failed",
+                    message=f"Payment capture failed: {error_data.get('message', 'Unknown error')}"
                 )
-                
+            
+            capture_response = orjson.loads(response.content)
+            capture_id = capture_response["purchase_units"][0]["payments"]["captures"][0]["id"]
+            capture_status = capture_response["status"]
+            captured_amount = Decimal(capture_response["purchase_units"][0]["payments"]["captures"][0]["amount"]["value"])
+            currency = capture_response["purchase_units"][0]["payments"]["captures"][0]["amount"]["currency_code"]
+            
+            logger.info("Payment captured successfully: %s", capture_id)
+            
+            return PaymentCaptureResponseSchema.model_construct(
+                success=True,
+                payment_id=paypal_order_id,
+                capture_id=capture_id,
+                status=capture_status,
+                amount=captured_amount,
+                currency=currency,
+                message="Payment captured successfully"
+            )
+            
         except Exception as e:
-            logger.error(f"Error capturing payment: {str(e)}")
-            return PaymentCaptureResponseSchema(
+            logger.error("Error capturing payment: %s", e)
+            return PaymentCaptureResponseSchema.model_construct(
                 success=False,
                 payment_id=paypal_order_id,
                 status="error",
-                message=f"Error capturing payment: {str(e)}",
-                timestamp=datetime.utcnow()
+                message=f"Error capturing payment: {str(e)}"
             )
     
     async def get_order_details(self, paypal_order_id: str) -> Dict[str, Any]:
-        """Get PayPal order details"""
+        """Get PayPal order details, reusing a recent lookup of the same order"""
+        # Validate configuration
+        if not self.client_id or not self.client_secret:
+            return None
+        
+        key = (self.client_id, self.mode, paypal_order_id)
+        cached = _ORDER_DETAILS_CACHE.get(key)
+        if cached and time.monotonic() < cached[0]:
+            _ORDER_DETAILS_CACHE.move_to_end(key)
+            return cached[1]
+        
+        # Concurrent pollers of the same order share one PayPal request
+        details = await single_flight("\0".join(("paypal_order",) + key), lambda: self._fetch_order_details(paypal_order_id))
+        if details is not None:
+            _ORDER_DETAILS_CACHE[key] = (time.monotonic() + order_details_ttl(details.get("status")), details)
+            _ORDER_DETAILS_CACHE.move_to_end(key)
+            while len(_ORDER_DETAILS_CACHE) > ORDER_DETAILS_CACHE_SIZE:
+                _ORDER_DETAILS_CACHE.popitem(last=False)
+        return details
+    
+    async def _fetch_order_details(self, paypal_order_id: str) -> Optional[Dict[str, Any]]:
         try:
-            # Validate configuration
-            if not self.client_id or not self.client_secret:
-                return None
-            
             access_token = await self._get_access_token()
+            _, read_headers = self._order_headers(access_token)
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/v2/checkout/orders/{paypal_order_id}",
-                    headers={
-                        "Authorization": f"Bearer {access_token}",
-                        "Content-Type": "application/json"
-                    }
-                )
+            client = await get_http_client()
+            response = await send_with_retry(functools.partial(
+                client.get,
+                f"{self.base_url}/v2/checkout/orders/{paypal_order_id}",
+                headers=read_headers
+            ), limiter=PAYPAL_LIMITER)
+            
+            if response.status_code == 200:
+                return orjson.loads(response.content)
+            else:
+                logger.error("Failed to get order details: %s", response.text)
+                return None
                 
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.error(f"Failed to get order details: {response.text}")
-                    return None
-                    
         except Exception as e:
-            logger.error(f"Error getting order details: {str(e)}")
+            logger.error("Error getting order details: %s", e)
             return None
     
+    async def verify_webhook_signature(self, headers, webhook_event: Dict[str, Any]) -> bool:
+        """Ask PayPal whether a webhook delivery was signed for PAYPAL_WEBHOOK_ID"""
+        try:
+            access_token = await self._get_access_token()
+            _, read_headers = self._order_headers(access_token)
+            
+            verification = {
+                "auth_algo": headers.get("paypal-auth-algo"),
+                "cert_url": headers.get("paypal-cert-url"),
+                "transmission_id": headers.get("paypal-transmission-id"),
+                "transmission_sig": headers.get("paypal-transmission-sig"),
+                "transmission_time": headers.get("paypal-transmission-time"),
+                "webhook_id": PAYPAL_WEBHOOK_ID,
+                "webhook_event": webhook_event
+            }
+            client = await get_http_client()
+            response = await send_with_retry(functools.partial(
+                client.post,
+                f"{self.base_url}/v1/notifications/verify-webhook-signature",
+                headers=read_headers,
+                content=orjson.dumps(verification)
+            ), limiter=PAYPAL_LIMITER)
+            
+            if response.status_code != 200:
+                logger.error("PayPal webhook verification failed: %s", response.text)
+                return False
+            return orjson.loads(response.content).get("verification_status") == "SUCCESS"
+            
+        except Exception as e:
+            logger.error("Error verifying webhook signature: %s", e)
+            return False
+    
     async def process_webhook(self, webhook_data: Dict[str, Any]) -> bool:
         """Process PayPal webhook events"""
         try:
-            logger.info(f"Processing webhook event: {webhook_data.get('event_type')}")
-            
             event_type = webhook_data.get("event_type")
-            resource = webhook_data.get("resource", {})
-            
-            if event_type == "PAYMENT.CAPTURE.COMPLETED":
-                # Payment was successfully captured
-                capture_id = resource.get("id")
-                status = resource.get("status")
-                amount = resource.get("amount", {}).get("value")
-                currency = resource.get("amount", {}).get("currency_code")
-                
-                logger.info(f"Payment capture completed: {capture_id}, Status: {status}, Amount: {amount} {currency}")
-                
-                # Here you would update your database with the payment status
-                # await update_order_payment_status(capture_id, status)
-                
-            elif event_type == "PAYMENT.CAPTURE.DENIED":
-                # Payment was denied
-                capture_id = resource.get("id")
-                logger.warning(f"Payment capture denied: {capture_id}")
-                
-                # Here you would update your database with the failed status
-                # await update_order_payment_status(capture_id, "denied")
-                
-            elif event_type == "CHECKOUT.ORDER.APPROVED":
-                # Order was approved by customer
-                order_id = resource.get("id")
-                logger.info(f"Order approved: {order_id}")
-                
-                # Here you would update your database with the approved status
-                # await update_order_status(order_id, "approved")
+            handler = _WEBHOOK_HANDLERS.get(event_type)
+            if handler is None:
+                # Not an event we act on; acknowledge it without further work
+                logger.debug("Ignoring webhook event: %s", event_type)
+                return True
             
+            logger.info("Processing webhook event: %s", event_type)
+            await handler(webhook_data.get("resource", {}))
             return True
             
         except Exception as e:
-            logger.error(f"Error processing webhook: {str(e)}")
+            logger.error("Error processing webhook: %s", e)
             return False
+    
+    async def process_webhook_batch(self, events: List[Dict[str, Any]]) -> List[bool]:
+        """Process a batch of PayPal webhook events, returning a success flag per event"""
+        # Events are handled in arrival order; once order updates are persisted,
+        # the whole batch can be written in a single transaction here
+        return [await self.process_webhook(event) for event in events]
 
 class CheckoutService:
     """Main checkout service that orchestrates the payment process"""
@@ -378,99 +499,142 @@ class CheckoutService:
             client_secret=paypal_client_secret,
             mode=paypal_mode
         )
+        # PayPal services for credentials sent in a checkout's payment_config, least
+        # recently used first; each keeps its own token, so concurrent checkouts for
+        # different merchants never share or overwrite one another's credentials
+        self._account_services: "OrderedDict[Tuple[str, str, str], PayPalCommerceService]" = OrderedDict()
+        # PayPal order id -> service the order was created with, least recently used first,
+        # so capture and lookup go to the same account without the caller resending credentials
+        self._order_services: "OrderedDict[str, PayPalCommerceService]" = OrderedDict()
     
-    def update_paypal_credentials(self, client_id: str, client_secret: str, mode: str = None):
-        """Update PayPal credentials dynamically"""
-        self.paypal_service.update_credentials(client_id, client_secret, mode)
+    def _paypal_service_for_order(self, paypal_order_id: str, payment_config: Optional[dict]) -> PayPalCommerceService:
+        """
+        PayPal service for an existing order: the payment_config credentials if given,
+        else the account this process created the order with, else the default one
+        """
+        if payment_config:
+            return self._paypal_service_for(payment_config)
+        service = self._order_services.get(paypal_order_id)
+        if service is None:
+            return self.paypal_service
+        self._order_services.move_to_end(paypal_order_id)
+        return service
+    
+    def _remember_order_service(self, paypal_order_id: str, service: PayPalCommerceService):
+        if service is self.paypal_service:
+            return
+        self._order_services[paypal_order_id] = service
+        self._order_services.move_to_end(paypal_order_id)
+        while len(self._order_services) > PAYPAL_ORDER_ACCOUNTS_SIZE:
+            self._order_services.popitem(last=False)
+    
+    def _paypal_service_for(self, payment_config: Optional[dict]) -> PayPalCommerceService:
+        """PayPal service for a checkout's payment_config, or the default one when it has no credentials"""
+        if not payment_config or not payment_config.get('client_id') or not payment_config.get('client_secret'):
+            return self.paypal_service
+        key = (payment_config['client_id'], payment_config['client_secret'], payment_config.get('mode', 'sandbox'))
+        default = self.paypal_service
+        if key == (default.client_id, default.client_secret, default.mode):
+            return default
+        service = self._account_services.get(key)
+        if service is None:
+            service = self._account_services[key] = PayPalCommerceService(*key)
+            while len(self._account_services) > PAYPAL_ACCOUNT_SERVICES_SIZE:
+                self._account_services.popitem(last=False)
+        else:
+            self._account_services.move_to_end(key)
+        return service
     
     async def process_checkout(self, checkout_request: CheckoutRequestSchema, payment_config: dict = None) -> CheckoutResponseSchema:
         """Process complete checkout flow"""
         try:
-            logger.info(f"Processing checkout for order: {checkout_request.order_id}")
-            
-            # Update PayPal credentials if provided in payment_config
-            if payment_config and payment_config.get('client_id') and payment_config.get('client_secret'):
-                logger.info("Updating PayPal credentials from payment config")
-                self.paypal_service.update_credentials(
-                    client_id=payment_config['client_id'],
-                    client_secret=payment_config['client_secret'],
-                    mode=payment_config.get('mode', 'sandbox')
-                )
+            logger.info("Processing checkout for order: %s", checkout_request.order_id)
+            
+            # Use the PayPal credentials from payment_config, if provided
+            paypal_service = self._paypal_service_for(payment_config)
             
             # Validate request
             if not checkout_request.items:
-                return CheckoutResponseSchema(
+                return CheckoutResponseSchema.model_construct(
                     success=False,
                     order_id=checkout_request.order_id,
                     status="failed",
                     message="No items in order",
-                    error_code="VALIDATION_ERROR",
-                    timestamp=datetime.utcnow()
+                    error_code="VALIDATION_ERROR"
                 )
             
-            # Calculate total to verify
-            calculated_total = (
-                checkout_request.subtotal + 
-                checkout_request.tax_amount + 
-                checkout_request.shipping_amount - 
-                checkout_request.discount_amount
+            # Calculate total to verify, in whole cents
+            calculated_cents = (
+                _to_cents(checkout_request.subtotal) + 
+                _to_cents(checkout_request.tax_amount) + 
+                _to_cents(checkout_request.shipping_amount) - 
+                _to_cents(checkout_request.discount_amount)
             )
             
-            if abs(calculated_total - checkout_request.total_amount) > Decimal('0.01'):
-                return CheckoutResponseSchema(
+            if abs(calculated_cents - _to_cents(checkout_request.total_amount)) > 1:
+                return CheckoutResponseSchema.model_construct(
                     success=False,
                     order_id=checkout_request.order_id,
                     status="failed",
                     message="Total amount calculation mismatch",
-                    error_code="VALIDATION_ERROR",
-                    timestamp=datetime.utcnow()
+                    error_code="VALIDATION_ERROR"
                 )
             
             # Create PayPal order
-            paypal_response = await self.paypal_service.create_paypal_order(checkout_request)
+            paypal_response = await paypal_service.create_paypal_order(checkout_request)
             
             if not paypal_response.success:
                 return paypal_response
+            self._remember_order_service(paypal_response.paypal_order_id, paypal_service)
             
             # Here you would typically save the order to your database
             # await save_order_to_database(checkout_request, paypal_response.paypal_order_id)
             
-            logger.info(f"Checkout processed successfully for order: {checkout_request.order_id}")
+            logger.info("Checkout processed successfully for order: %s", checkout_request.order_id)
             return paypal_response
             
         except Exception as e:
-            logger.error(f"Error processing checkout: {str(e)}")
-            return CheckoutResponseSchema(
+            logger.error("Error processing checkout: %s", e)
+            return CheckoutResponseSchema.model_construct(
                 success=False,
                 order_id=checkout_request.order_id,
                 status="error",
                 message=f"Error processing checkout: {str(e)}",
-                error_code="INTERNAL_ERROR",
-                timestamp=datetime.utcnow()
+                error_code="INTERNAL_ERROR"
             )
     
-    async def capture_payment(self, paypal_order_id: str, order_id: str) -> PaymentCaptureResponseSchema:
-        """Capture payment for an approved order"""
+    async def capture_payment(self, paypal_order_id: str, order_id: str, payment_config: dict = None) -> PaymentCaptureResponseSchema:
+        """
+        Capture payment for an approved order
+        
+        Pass the payment_config the order was created with when the capture may be
+        handled by another worker than the checkout.
+        """
         try:
-            logger.info(f"Capturing payment for order: {order_id}")
+            logger.info("Capturing payment for order: %s", order_id)
             
-            capture_response = await self.paypal_service.capture_payment(paypal_order_id, order_id)
+            paypal_service = self._paypal_service_for_order(paypal_order_id, payment_config)
+            capture_response = await paypal_service.capture_payment(paypal_order_id, order_id)
             
             if capture_response.success:
                 # Here you would update your database with the captured payment
                 # await update_order_payment_status(order_id, "captured", capture_response.capture_id)
-                logger.info(f"Payment captured successfully for order: {order_id}")
+                logger.info("Payment captured successfully for order: %s", order_id)
             else:
-                logger.error(f"Payment capture failed for order: {order_id}")
+                logger.error("Payment capture failed for order: %s", order_id)
             
             return capture_response
             
         except Exception as e:
-            logger.error(f"Error capturing payment: {str(e)}")
-            return PaymentCaptureResponseSchema(
+            logger.error("Error capturing payment: %s", e)
+            return PaymentCaptureResponseSchema.model_construct(
                 success=False,
                 payment_id=paypal_order_id,
                 status="error",
-                message=f"Error capturing payment: {str(e)}",
-                timestamp=datetime.utcnow()
-            ) 
\ No newline at end of file
+                message=f"Error capturing payment: {str(e)}"
+            ) 
+    
+    async def get_order_details(self, paypal_order_id: str, payment_config: dict = None) -> Optional[Dict[str, Any]]:
+        """Get PayPal order details from the account the order was created with"""
+        paypal_service = self._paypal_service_for_order(paypal_order_id, payment_config)
+        return await paypal_service.get_order_details(paypal_order_id)
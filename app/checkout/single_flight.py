@@ -0,0 +1,26 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+# Calls currently in progress, keyed by the caller-supplied request key
+_INFLIGHT: Dict[str, "asyncio.Task[Any]"] = {}
+
+
+async def single_flight(key: str, coro_factory: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Run coro_factory once for concurrent callers sharing the same key
+
+    The first caller starts the call; callers arriving while it is in flight
+    await the same result (or exception). The shared call is shielded, so one
+    caller being cancelled does not cancel it for the others.
+    """
+    task = _INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.ensure_future(coro_factory())
+        _INFLIGHT[key] = task
+
+        def _forget(done: "asyncio.Task[Any]") -> None:
+            if _INFLIGHT.get(key) is done:
+                del _INFLIGHT[key]
+
+        task.add_done_callback(_forget)
+    return await asyncio.shield(task)
@@ -0,0 +1,58 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Post-response work (order logging, webhook processing) handed off by request
+# handlers and run by a fixed pool of worker tasks started in the app lifespan
+_queue: Optional["asyncio.Queue[Tuple[Callable[..., Awaitable[Any]], Tuple[Any, ...]]]"] = None
+_workers: List["asyncio.Task[None]"] = []
+
+# Pending jobs allowed before enqueue() makes callers wait for a free slot
+QUEUE_MAXSIZE = 10000
+# How long shutdown waits for queued jobs to finish before cancelling workers
+DRAIN_TIMEOUT_SECONDS = 10.0
+
+
+async def _worker(queue: "asyncio.Queue[Tuple[Callable[..., Awaitable[Any]], Tuple[Any, ...]]]"):
+    while True:
+        func, args = await queue.get()
+        try:
+            await func(*args)
+        except Exception:
+            logger.exception("Queued task %s failed", getattr(func, "__name__", func))
+        finally:
+            queue.task_done()
+
+
+def start_workers(count: int):
+    """Create the task queue and start count worker tasks on the running loop"""
+    global _queue
+    _queue = asyncio.Queue(maxsize=QUEUE_MAXSIZE)
+    for _ in range(max(1, count)):
+        _workers.append(asyncio.create_task(_worker(_queue)))
+    logger.info("Started %d checkout task workers", len(_workers))
+
+
+async def stop_workers():
+    """Let queued jobs finish (up to DRAIN_TIMEOUT_SECONDS), then stop the workers"""
+    global _queue
+    if _queue is None:
+        return
+    try:
+        await asyncio.wait_for(_queue.join(), DRAIN_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning("Stopping checkout task workers with %d jobs still queued", _queue.qsize())
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _queue = None
+
+
+async def enqueue(func: Callable[..., Awaitable[Any]], *args: Any):
+    """Queue func(*args) to run on a worker after the current request"""
+    if _queue is None:
+        raise RuntimeError("Checkout task workers are not running")
+    await _queue.put((func, args))
@@ -0,0 +1,35 @@
+import time
+from collections import OrderedDict
+
+# PayPal retries a webhook until it is acknowledged, so the same event can
+# arrive several times; remember recently seen event ids for a day
+SEEN_TTL_SECONDS = 86400.0
+SEEN_MAXSIZE = 100_000
+
+# event id -> monotonic time after which it may be processed again, oldest first
+_SEEN: "OrderedDict[str, float]" = OrderedDict()
+
+
+def first_delivery(event_id: str) -> bool:
+    """
+    Record event_id and return True if it has not been seen within SEEN_TTL_SECONDS
+
+    Only the SEEN_MAXSIZE most recent ids are kept. This is per-process: with
+    several workers a duplicate routed to another worker is not detected.
+    """
+    now = time.monotonic()
+    while _SEEN:
+        oldest_id, expires_at = next(iter(_SEEN.items()))
+        if expires_at > now and len(_SEEN) < SEEN_MAXSIZE:
+            break
+        del _SEEN[oldest_id]
+
+    if event_id in _SEEN:
+        return False
+    _SEEN[event_id] = now + SEEN_TTL_SECONDS
+    return True
+
+
+def forget_delivery(event_id: str):
+    """Forget event_id so a redelivery is processed, e.g. after failing to queue it"""
+    _SEEN.pop(event_id, None)
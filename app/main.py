@@ -1,19 +1,16 @@
+import functools
+import importlib
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.checkout.paypal.routes import router as paypal_router
-from app.checkout.routes import router as checkout_router
-from app.checkout.paypal.test_routes import router as paypal_test_router
-from app.checkout.credit_card.stripe.routes import router as stripe_router
-from app.checkout.credit_card.stripe.test_routes import router as stripe_test_router
-from app.checkout.credit_card.square.routes import router as square_router
-from app.checkout.credit_card.square.test_routes import router as square_test_router
-from app.checkout.credit_card.authorize.routes import router as authorize_router
-from app.checkout.credit_card.authorize.test_routes import router as authorize_test_router
-from app.checkout.credit_card.paypal_commerce.routes import router as paypal_card_router
-from app.checkout.credit_card.paypal_commerce.test_routes import router as paypal_card_test_router
-from app.checkout.klarna.routes import router as klarna_router
-from app.checkout.klarna.test_routes import router as klarna_test_router
+from app.checkout.paypal.routes import router as paypal_router, process_webhook_events
 from app.admin.routes import router as admin_router
+from app.checkout.http_client import get_http_client, close_http_client
+from app.checkout.task_queue import start_workers, stop_workers
+from app.checkout.micro_batch import MicroBatcher
+from app.checkout.services import CheckoutService
+from app.checkout.paypal.services import PayPalCommerceService
 from config import settings
 import logging
 
@@ -21,10 +18,44 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Optional payment provider routers: provider -> (mount prefix, router modules).
+# Only providers in ENABLED_PAYMENT_PROVIDERS are imported, so workers don't load
+# SDKs for providers the deployment doesn't use.
+PAYMENT_PROVIDER_ROUTERS = {
+    "stripe": ("/checkout/credit-card/stripe", ("app.checkout.credit_card.stripe.routes",)),
+    "square": ("/checkout/credit-card/square", ("app.checkout.credit_card.square.routes", "app.checkout.credit_card.square.test_routes")),
+    "authorize": ("/checkout/credit-card/authorize", ("app.checkout.credit_card.authorize.routes",)),
+    "paypal-commerce": ("/checkout/credit-card/paypal-commerce", ("app.checkout.credit_card.paypal_commerce.routes",)),
+    "klarna": ("/checkout/klarna", ("app.checkout.klarna.routes",)),
+}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the shared outbound HTTP client once per worker and close it on shutdown
+    await get_http_client()
+    # Build the PayPal checkout services once settings are loaded, one per process
+    app.state.checkout_service = CheckoutService()
+    app.state.paypal_service = PayPalCommerceService()
+    # Workers for post-response jobs queued by the PayPal routes
+    start_workers(settings.CHECKOUT_TASK_WORKERS)
+    # PayPal webhook events are handed to the checkout PayPal service in micro-batches
+    app.state.webhook_batcher = MicroBatcher(
+        functools.partial(process_webhook_events, app.state.checkout_service.paypal_service),
+        max_size=settings.PAYPAL_WEBHOOK_BATCH_SIZE,
+        max_wait=settings.PAYPAL_WEBHOOK_BATCH_WAIT_MS / 1000
+    )
+    app.state.webhook_batcher.start()
+    yield
+    await app.state.webhook_batcher.stop()
+    await stop_workers()
+    await close_http_client()
+
 app = FastAPI(
     title="E-commerce API",
     description="FastAPI backend for e-commerce application with PayPal Commerce Platform integration",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Add CORS middleware to allow requests from Next.js frontend
@@ -32,25 +63,22 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=[settings.FRONTEND_URL],  # Use env var
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    # Explicit lists let preflight responses be built once instead of echoing request headers
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Authorization", "Content-Type", "Prefer"],
+    # Location carries the status URL of a checkout accepted with "Prefer: respond-async"
+    expose_headers=["Location"],
 )
 
 # Include routers
 app.include_router(paypal_router, prefix="/checkout/paypal")
-app.include_router(checkout_router, prefix="/checkout")
-app.include_router(paypal_test_router, prefix="/checkout/paypal")
-app.include_router(stripe_router, prefix="/checkout/credit-card/stripe")
-app.include_router(stripe_test_router, prefix="/checkout/credit-card/stripe")
-app.include_router(square_router, prefix="/checkout/credit-card/square")
-app.include_router(square_test_router, prefix="/checkout/credit-card/square")
-app.include_router(authorize_router, prefix="/checkout/credit-card/authorize")
-app.include_router(authorize_test_router, prefix="/checkout/credit-card/authorize")
-app.include_router(paypal_card_router, prefix="/checkout/credit-card/paypal-commerce")
-app.include_router(paypal_card_test_router, prefix="/checkout/credit-card/paypal-commerce")
-app.include_router(klarna_router, prefix="/checkout/klarna")
-app.include_router(klarna_test_router, prefix="/checkout/klarna")
 app.include_router(admin_router, prefix="/admin")
+for provider in settings.ENABLED_PAYMENT_PROVIDERS:
+    if provider not in PAYMENT_PROVIDER_ROUTERS:
+        raise ValueError(f"Unknown payment provider in ENABLED_PAYMENT_PROVIDERS: {provider}")
+    prefix, modules = PAYMENT_PROVIDER_ROUTERS[provider]
+    for module in modules:
+        app.include_router(importlib.import_module(module).router, prefix=prefix)
 
 @app.get("/")
 async def root():
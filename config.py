@@ -4,31 +4,100 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# Settings are plain module constants so hot paths can import them directly;
+# the Settings class mirrors them for code that reads settings.<NAME>
+
+# PayPal Commerce Platform Configuration
+PAYPAL_CLIENT_ID: str = os.getenv("PAYPAL_CLIENT_ID", "")
+PAYPAL_CLIENT_SECRET: str = os.getenv("PAYPAL_CLIENT_SECRET", "")
+PAYPAL_MODE: str = os.getenv("PAYPAL_MODE", "sandbox")  # sandbox or live
+
+# PayPal REST API hosts; any mode other than sandbox uses live
+PAYPAL_SANDBOX_BASE_URL: str = "https://api-m.sandbox.paypal.com"
+PAYPAL_LIVE_BASE_URL: str = "https://api-m.paypal.com"
+
+# Resolved once at import for the configured credentials and mode
+PAYPAL_CONFIGURED: bool = bool(PAYPAL_CLIENT_ID and PAYPAL_CLIENT_SECRET)
+PAYPAL_BASE_URL: str = PAYPAL_SANDBOX_BASE_URL if PAYPAL_MODE == "sandbox" else PAYPAL_LIVE_BASE_URL
+
+# Maximum concurrent outbound requests per payment provider
+PAYPAL_MAX_CONCURRENCY: int = int(os.getenv("PAYPAL_MAX_CONCURRENCY", "32"))
+KLARNA_MAX_CONCURRENCY: int = int(os.getenv("KLARNA_MAX_CONCURRENCY", "32"))
+
+# Worker tasks processing queued post-response work (order logging, webhooks)
+CHECKOUT_TASK_WORKERS: int = int(os.getenv("CHECKOUT_TASK_WORKERS", "8"))
+
+# Honour "Prefer: respond-async" on PayPal checkout. Pending checkouts are kept in
+# the worker's memory, so this stays off unless explicitly enabled and is never
+# on with several uvicorn workers. Workers must be set with WEB_CONCURRENCY (uvicorn's
+# --workers default): a --workers flag is not visible here
+PAYPAL_ASYNC_CHECKOUT: bool = (
+    os.getenv("PAYPAL_ASYNC_CHECKOUT", "false").lower() == "true"
+    and int(os.getenv("WEB_CONCURRENCY", "1")) <= 1
+)
+
+# PayPal webhook events are processed in batches of up to this many events,
+# flushed at most this many milliseconds after the first one arrives
+PAYPAL_WEBHOOK_BATCH_SIZE: int = int(os.getenv("PAYPAL_WEBHOOK_BATCH_SIZE", "50"))
+PAYPAL_WEBHOOK_BATCH_WAIT_MS: int = int(os.getenv("PAYPAL_WEBHOOK_BATCH_WAIT_MS", "50"))
+# Webhook id from the PayPal developer dashboard; webhook signatures are verified when set
+PAYPAL_WEBHOOK_ID: str = os.getenv("PAYPAL_WEBHOOK_ID", "")
+
+# Payment providers whose routers are mounted, comma-separated; the PayPal
+# checkout and admin routes are always available
+ENABLED_PAYMENT_PROVIDERS: tuple = tuple(
+    provider.strip()
+    for provider in os.getenv("ENABLED_PAYMENT_PROVIDERS", "stripe,square,authorize,paypal-commerce,klarna").split(",")
+    if provider.strip()
+)
+
+# Application Configuration
+APP_ENV: str = os.getenv("APP_ENV", "development")
+DEBUG: bool = os.getenv("DEBUG", "true").lower() == "true"
+
+# Frontend URLs
+FRONTEND_URL: str = os.getenv("FRONTEND_URL", "http://localhost:3000")
+BACKEND_URL: str = os.getenv("BACKEND_URL", "http://127.0.0.1:8000")
+
+# Database Configuration (if needed)
+DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+
+
 class Settings:
     """Application settings"""
     
-    # PayPal Commerce Platform Configuration
-    PAYPAL_CLIENT_ID: str = os.getenv("PAYPAL_CLIENT_ID", "")
-    PAYPAL_CLIENT_SECRET: str = os.getenv("PAYPAL_CLIENT_SECRET", "")
-    PAYPAL_MODE: str = os.getenv("PAYPAL_MODE", "sandbox")  # sandbox or live
-    
-    # Application Configuration
-    APP_ENV: str = os.getenv("APP_ENV", "development")
-    DEBUG: bool = os.getenv("DEBUG", "true").lower() == "true"
-    
-    # Frontend URLs
-    FRONTEND_URL: str = os.getenv("FRONTEND_URL", "http://localhost:3000")
-    BACKEND_URL: str = os.getenv("BACKEND_URL", "http://127.0.0.1:8000")
-    
-    # Database Configuration (if needed)
-    DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+    PAYPAL_CLIENT_ID: str = PAYPAL_CLIENT_ID
+    PAYPAL_CLIENT_SECRET: str = PAYPAL_CLIENT_SECRET
+    PAYPAL_MODE: str = PAYPAL_MODE
+    PAYPAL_SANDBOX_BASE_URL: str = PAYPAL_SANDBOX_BASE_URL
+    PAYPAL_LIVE_BASE_URL: str = PAYPAL_LIVE_BASE_URL
+    PAYPAL_CONFIGURED: bool = PAYPAL_CONFIGURED
+    PAYPAL_BASE_URL: str = PAYPAL_BASE_URL
+    PAYPAL_MAX_CONCURRENCY: int = PAYPAL_MAX_CONCURRENCY
+    KLARNA_MAX_CONCURRENCY: int = KLARNA_MAX_CONCURRENCY
+    CHECKOUT_TASK_WORKERS: int = CHECKOUT_TASK_WORKERS
+    PAYPAL_ASYNC_CHECKOUT: bool = PAYPAL_ASYNC_CHECKOUT
+    PAYPAL_WEBHOOK_BATCH_SIZE: int = PAYPAL_WEBHOOK_BATCH_SIZE
+    PAYPAL_WEBHOOK_BATCH_WAIT_MS: int = PAYPAL_WEBHOOK_BATCH_WAIT_MS
+    PAYPAL_WEBHOOK_ID: str = PAYPAL_WEBHOOK_ID
+    ENABLED_PAYMENT_PROVIDERS: tuple = ENABLED_PAYMENT_PROVIDERS
+    APP_ENV: str = APP_ENV
+    DEBUG: bool = DEBUG
+    FRONTEND_URL: str = FRONTEND_URL
+    BACKEND_URL: str = BACKEND_URL
+    DATABASE_URL: str = DATABASE_URL
     
     @classmethod
     def validate_paypal_config(cls) -> bool:
         """Validate PayPal configuration"""
-        if not cls.PAYPAL_CLIENT_ID or not cls.PAYPAL_CLIENT_SECRET:
-            return False
-        return True
+        return cls.PAYPAL_CONFIGURED
+    
+    @classmethod
+    def paypal_base_url(cls, mode: str) -> str:
+        """PayPal REST API base URL for a mode"""
+        if mode == cls.PAYPAL_MODE:
+            return cls.PAYPAL_BASE_URL
+        return cls.PAYPAL_SANDBOX_BASE_URL if mode == "sandbox" else cls.PAYPAL_LIVE_BASE_URL
     
     @classmethod
     def get_paypal_config(cls) -> dict:
@@ -0,0 +1,12 @@
+import httpx
+import pytest
+
+import app.checkout.http_client as http_client
+
+
+@pytest.fixture
+def mock_provider(monkeypatch):
+    """Route the shared outbound HTTP client through a handler: mock_provider(handler)"""
+    def install(handler):
+        monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return install
@@ -0,0 +1,34 @@
+from decimal import Decimal
+
+import pytest
+from pydantic import ValidationError
+
+from app.checkout.schemas import CheckoutRequestSchema
+
+CHECKOUT = dict(
+    order_id="order-1",
+    customer=dict(email="buyer@example.com", first_name="Ada", last_name="Lovelace"),
+    items=[dict(product_id="p1", name="Widget", quantity=2, unit_price="9.995")],
+    shipping_address=dict(line1="1 Main St", city="Springfield", state="IL", postal_code="62701", country_code="US"),
+    subtotal="19.99",
+    total_amount="19.99",
+)
+
+
+def test_float_artifact_amounts_are_rounded_to_cents():
+    checkout = CheckoutRequestSchema(**{**CHECKOUT, "subtotal": 19.990000000000002, "tax_amount": 0.1 + 0.2, "total_amount": 20.290000000000003})
+
+    assert checkout.subtotal == Decimal("19.99")
+    assert checkout.tax_amount == Decimal("0.30")
+    assert checkout.total_amount == Decimal("20.29")
+    assert checkout.items[0].unit_price == Decimal("10.00")
+
+
+def test_non_numeric_amount_is_rejected():
+    with pytest.raises(ValidationError):
+        CheckoutRequestSchema(**{**CHECKOUT, "total_amount": "twenty"})
+
+
+def test_amount_beyond_max_digits_is_rejected():
+    with pytest.raises(ValidationError):
+        CheckoutRequestSchema(**{**CHECKOUT, "total_amount": "12345678901.00"})
@@ -0,0 +1,91 @@
+import asyncio
+import base64
+
+import httpx
+
+from app.checkout.schemas import CheckoutRequestSchema
+from app.checkout.services import CheckoutService
+
+CHECKOUT = dict(
+    order_id="order-1",
+    customer=dict(email="buyer@example.com", first_name="Ada", last_name="Lovelace"),
+    items=[dict(product_id="p1", name="Widget", quantity=2, unit_price="10.00")],
+    shipping_address=dict(line1="1 Main St", city="Springfield", state="IL", postal_code="62701", country_code="US"),
+    subtotal="20.00",
+    total_amount="20.00",
+)
+
+
+def paypal_api(orders):
+    """Minimal PayPal API issuing one token per client id; records who created each order"""
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/v1/oauth2/token":
+            client_id = base64.b64decode(request.headers["authorization"].split()[1]).decode().split(":")[0]
+            # Slow enough for concurrent checkouts to overlap
+            await asyncio.sleep(0.01)
+            return httpx.Response(200, json={"access_token": f"token-{client_id}", "expires_in": 32400})
+        if request.url.path == "/v2/checkout/orders":
+            orders.append(request.headers["authorization"])
+            return httpx.Response(201, json={"id": f"PAYPAL-{len(orders)}"})
+        # Orders can only be read or captured by the account that created them
+        paypal_order_id = request.url.path.split("/")[4]
+        if request.headers["authorization"] != orders[int(paypal_order_id.split("-")[1]) - 1]:
+            return httpx.Response(404, json={"name": "RESOURCE_NOT_FOUND", "message": "order not found"})
+        if request.url.path.endswith("/capture"):
+            capture = {"id": "CAPTURE-1", "amount": {"value": "20.00", "currency_code": "USD"}}
+            return httpx.Response(201, json={"status": "COMPLETED", "purchase_units": [{"payments": {"captures": [capture]}}]})
+        if request.method == "GET":
+            return httpx.Response(200, json={"id": paypal_order_id, "status": "APPROVED"})
+        return httpx.Response(500, text=f"unexpected {request.url.path}")
+
+    return handler
+
+
+def test_concurrent_checkouts_use_their_own_paypal_credentials(mock_provider):
+    orders = []
+    mock_provider(paypal_api(orders))
+    checkout_service = CheckoutService(paypal_client_id="default", paypal_client_secret="default-secret")
+
+    async def checkout(client_id):
+        request = CheckoutRequestSchema(**CHECKOUT)
+        return await checkout_service.process_checkout(
+            request, {"client_id": client_id, "client_secret": f"{client_id}-secret", "mode": "sandbox"}
+        )
+
+    async def run():
+        return await asyncio.gather(*(checkout(client_id) for client_id in ["merchant-a", "merchant-b"] * 3))
+
+    responses = asyncio.run(run())
+
+    assert all(response.success for response in responses)
+    assert sorted(orders) == ["Bearer token-merchant-a"] * 3 + ["Bearer token-merchant-b"] * 3
+    assert checkout_service.paypal_service.client_id == "default"
+
+
+def test_checkout_without_credentials_uses_default_paypal_account(mock_provider):
+    orders = []
+    mock_provider(paypal_api(orders))
+    checkout_service = CheckoutService(paypal_client_id="default", paypal_client_secret="default-secret")
+
+    response = asyncio.run(checkout_service.process_checkout(CheckoutRequestSchema(**CHECKOUT)))
+
+    assert response.success
+    assert orders == ["Bearer token-default"]
+
+
+def test_capture_and_lookup_use_the_account_that_created_the_order(mock_provider):
+    orders = []
+    mock_provider(paypal_api(orders))
+    checkout_service = CheckoutService(paypal_client_id="default", paypal_client_secret="default-secret")
+    payment_config = {"client_id": "merchant-a", "client_secret": "merchant-a-secret", "mode": "sandbox"}
+
+    async def run():
+        created = await checkout_service.process_checkout(CheckoutRequestSchema(**CHECKOUT), payment_config)
+        details = await checkout_service.get_order_details(created.paypal_order_id)
+        captured = await checkout_service.capture_payment(created.paypal_order_id, "order-1")
+        return details, captured
+
+    details, captured = asyncio.run(run())
+
+    assert details == {"id": "PAYPAL-1", "status": "APPROVED"}
+    assert captured.success, captured
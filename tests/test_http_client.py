@@ -0,0 +1,53 @@
+import asyncio
+
+import httpx
+import pytest
+
+import app.checkout.http_client as http_client
+from app.checkout.http_client import send_with_retry
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(http_client, "RETRY_INITIAL_WAIT_SECONDS", 0)
+    monkeypatch.setattr(http_client, "RETRY_MAX_WAIT_SECONDS", 0)
+
+
+def counting(*outcomes):
+    """A send() returning or raising each outcome in turn, and the list of attempts made"""
+    attempts = []
+
+    async def send():
+        outcome = outcomes[len(attempts)]
+        attempts.append(outcome)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return send, attempts
+
+
+def test_non_idempotent_request_is_not_retried_after_a_server_error():
+    send, attempts = counting(httpx.Response(503), httpx.Response(201))
+
+    response = asyncio.run(send_with_retry(send, idempotent=False))
+
+    assert response.status_code == 503
+    assert len(attempts) == 1
+
+
+def test_non_idempotent_request_is_not_retried_after_a_read_timeout():
+    send, attempts = counting(httpx.ReadTimeout("slow"), httpx.Response(201))
+
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(send_with_retry(send, idempotent=False))
+    assert len(attempts) == 1
+
+
+def test_non_idempotent_request_is_retried_when_it_could_not_connect():
+    send, attempts = counting(httpx.ConnectError("refused"), httpx.Response(201))
+
+    response = asyncio.run(send_with_retry(send, idempotent=False))
+
+    assert response.status_code == 201
+    assert len(attempts) == 2
@@ -0,0 +1,35 @@
+import asyncio
+
+import httpx
+import orjson
+
+from app.checkout.klarna.services import KlarnaService, KlarnaSessionRequestSchema
+
+
+def test_session_amounts_are_rounded_to_cents(mock_provider):
+    payloads = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payloads.append(orjson.loads(request.content))
+        return httpx.Response(200, json={"session_id": "s1", "client_token": "t1"})
+
+    mock_provider(handler)
+    request = KlarnaSessionRequestSchema(
+        order_id="order-1",
+        customer={},
+        items=[{"product_id": "p1", "name": "Widget", "quantity": 3, "unit_price": 19.99}],
+        shipping_address={"country_code": "US"},
+        subtotal=59.97,
+        tax_amount=0,
+        shipping_amount=0,
+        discount_amount=0,
+        total_amount=59.97,
+    )
+
+    response = asyncio.run(KlarnaService("user", "pass").create_session(request))
+
+    assert response.success
+    [payload] = payloads
+    [line] = payload["order_lines"]
+    assert (line["unit_price"], line["total_amount"]) == (1999, 5997)
+    assert payload["order_amount"] == 5997
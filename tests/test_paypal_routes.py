@@ -0,0 +1,65 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.checkout.paypal.dependencies import get_checkout_service, get_webhook_batcher
+from app.checkout.paypal.routes import router
+
+
+class RecordingBatcher:
+    def __init__(self):
+        self.events = []
+
+    async def put(self, event):
+        self.events.append(event)
+
+
+def webhook_client(batcher):
+    app = FastAPI()
+    app.include_router(router, prefix="/checkout/paypal")
+    app.dependency_overrides[get_checkout_service] = lambda: None
+    app.dependency_overrides[get_webhook_batcher] = lambda: batcher
+    return TestClient(app)
+
+
+def test_webhook_with_malformed_content_length_is_rejected():
+    batcher = RecordingBatcher()
+    response = webhook_client(batcher).post(
+        "/checkout/paypal/webhook",
+        content=b'{"id": "WH-1"}',
+        headers={"Content-Length": "not-a-number"}
+    )
+
+    assert response.status_code == 400
+    assert batcher.events == []
+
+
+class StubCheckoutService:
+    async def get_order_details(self, paypal_order_id):
+        return {
+            "id": paypal_order_id,
+            "status": "COMPLETED",
+            "purchase_units": [{"reference_id": "order-1"}],
+            "payer": {"email_address": "buyer@example.com", "name": {"given_name": "Ada"}},
+        }
+
+
+def order_client():
+    app = FastAPI()
+    app.include_router(router, prefix="/checkout/paypal")
+    app.dependency_overrides[get_checkout_service] = StubCheckoutService
+    return TestClient(app)
+
+
+def test_order_status_omits_payer_details():
+    response = order_client().get("/checkout/paypal/order/PAYPAL-1", params={"order_id": "order-1"})
+
+    assert response.status_code == 200
+    assert response.json() == {"paypal_order_id": "PAYPAL-1", "order_id": "order-1", "status": "COMPLETED"}
+    assert response.headers["cache-control"] == "private, max-age=300"
+
+
+def test_order_status_requires_the_matching_order_id():
+    client = order_client()
+
+    assert client.get("/checkout/paypal/order/PAYPAL-1", params={"order_id": "order-2"}).status_code == 404
+    assert client.get("/checkout/paypal/order/PAYPAL-1").status_code == 422
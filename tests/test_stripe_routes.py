@@ -0,0 +1,62 @@
+import hashlib
+import hmac
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.checkout.credit_card.stripe import routes
+from app.checkout.credit_card.stripe.schemas import StripeWebhookEventSchema
+from app.checkout.credit_card.stripe.services import StripeService
+
+WEBHOOK_SECRET = "whsec_test"
+
+
+def signed(payload: bytes) -> dict:
+    timestamp = str(int(time.time()))
+    signature = hmac.new(WEBHOOK_SECRET.encode(), timestamp.encode() + b"." + payload, hashlib.sha256).hexdigest()
+    return {"Stripe-Signature": f"t={timestamp},v1={signature}", "Content-Type": "application/json"}
+
+
+def webhook_client(monkeypatch, handled, webhook_secret=WEBHOOK_SECRET):
+    async def record(event, stripe_service):
+        handled.append(event)
+
+    monkeypatch.setattr(routes, "process_webhook_event", record)
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/checkout/credit-card/stripe")
+    app.dependency_overrides[routes.get_stripe_service] = lambda: StripeService("sk_test_1234567890abcdef", webhook_secret)
+    return TestClient(app)
+
+
+def test_signed_webhook_is_parsed_into_event_schema(monkeypatch):
+    handled = []
+    payload = b'{"id": "evt_1", "type": "payment_intent.succeeded", "created": 1700000000, "livemode": false, "data": {"object": {"metadata": {"order_id": "order-1"}}}}'
+
+    response = webhook_client(monkeypatch, handled).post("/checkout/credit-card/stripe/webhook", content=payload, headers=signed(payload))
+
+    assert response.status_code == 200
+    [event] = handled
+    assert isinstance(event, StripeWebhookEventSchema)
+    assert event.type == "payment_intent.succeeded"
+    assert event.data["object"]["metadata"]["order_id"] == "order-1"
+
+
+def test_signed_webhook_without_event_envelope_is_rejected(monkeypatch):
+    handled = []
+    payload = b'{"id": "evt_1", "type": "payment_intent.succeeded"}'
+
+    response = webhook_client(monkeypatch, handled).post("/checkout/credit-card/stripe/webhook", content=payload, headers=signed(payload))
+
+    assert response.status_code == 400
+    assert handled == []
+
+
+def test_webhook_is_rejected_without_a_configured_secret(monkeypatch):
+    handled = []
+    payload = b'{"id": "evt_1", "type": "payment_intent.succeeded", "created": 1700000000, "livemode": false, "data": {"object": {}}}'
+
+    response = webhook_client(monkeypatch, handled, webhook_secret=None).post("/checkout/credit-card/stripe/webhook", content=payload, headers=signed(payload))
+
+    assert response.status_code == 400
+    assert handled == []
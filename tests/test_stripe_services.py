@@ -0,0 +1,130 @@
+import asyncio
+import itertools
+import urllib.parse
+
+import httpx
+
+from app.checkout.credit_card.stripe.schemas import StripeCheckoutRequestSchema
+from app.checkout.credit_card.stripe.services import StripeService
+
+CHECKOUT = dict(
+    order_id="order-1",
+    customer=dict(email="buyer@example.com", first_name="Ada", last_name="Lovelace", phone="+1 555 123 4567"),
+    items=[dict(product_id="p1", name="Widget", quantity=2, unit_price="10.50")],
+    shipping_address=dict(line1="1 Main St", city="Springfield", state="IL", postal_code="62701", country_code="us"),
+    subtotal=2100,
+    total_amount=2100,
+    payment_method=dict(type="card", card_number="4242424242424242", expiry_month=1, expiry_year=2030, cvc="123", name_on_card="Ada Lovelace"),
+)
+
+
+def stripe_api(payment_intent_calls):
+    """
+    Minimal Stripe API with Stripe's idempotency rules: a replayed key returns the
+    first response, and a replayed key with different params is a 400 idempotency_error
+    """
+    object_ids = itertools.count(1)
+    idempotent_requests = {}
+
+    def create(request, body, make):
+        key = request.headers.get("idempotency-key")
+        if key is None:
+            return make()
+        if key in idempotent_requests:
+            first_body, first_response = idempotent_requests[key]
+            if first_body != body:
+                return httpx.Response(400, json={"error": {"type": "idempotency_error", "message": "Keys for idempotent requests can only be used with the same parameters they were first used with."}})
+            return first_response
+        idempotent_requests[key] = (body, make())
+        return idempotent_requests[key][1]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        body = urllib.parse.parse_qs(request.content.decode())
+        if path == "/v1/customers" and request.method == "GET":
+            return httpx.Response(200, json={"data": []})
+        if path == "/v1/customers":
+            return httpx.Response(200, json={"id": "cus_1", "email": "buyer@example.com", "created": 1700000000, "metadata": {}})
+        if path == "/v1/payment_methods":
+            return create(request, body, lambda: httpx.Response(200, json={"id": f"pm_{next(object_ids)}", "type": "card", "card": {"brand": "visa"}, "billing_details": {}, "created": 1700000000}))
+        if path == "/v1/payment_intents":
+            payment_intent_calls.append((request.headers, body))
+            return create(request, body, lambda: httpx.Response(200, json={"id": f"pi_{next(object_ids)}", "client_secret": "secret", "status": "succeeded", "amount": 2100, "currency": "usd", "created": 1700000000}))
+        return httpx.Response(500, text=f"unexpected {path}")
+
+    return handler
+
+
+def create_payment_intent(mock_provider, checkouts=(CHECKOUT,), handler=None):
+    payment_intent_calls = []
+    mock_provider(handler or stripe_api(payment_intent_calls))
+    service = StripeService("sk_test_1234567890abcdef")
+
+    async def run():
+        return [await service.create_payment_intent(StripeCheckoutRequestSchema(**checkout), {}) for checkout in checkouts]
+
+    return asyncio.run(run()), payment_intent_calls
+
+
+def test_retried_checkout_replays_the_same_payment(mock_provider):
+    (first, second), calls = create_payment_intent(mock_provider, checkouts=(CHECKOUT, CHECKOUT))
+
+    assert first.success and second.success, (first, second)
+    assert first.payment_intent.id == second.payment_intent.id
+    (first_headers, first_body), (second_headers, second_body) = calls
+    assert first_body == second_body
+    assert first_headers["idempotency-key"] == second_headers["idempotency-key"]
+
+
+def test_retry_with_another_card_is_a_new_payment_attempt(mock_provider):
+    other_card = {**CHECKOUT, "payment_method": {**CHECKOUT["payment_method"], "card_number": "5555555555554444"}}
+    (first, second), calls = create_payment_intent(mock_provider, checkouts=(CHECKOUT, other_card))
+
+    assert first.success and second.success, (first, second)
+    assert first.payment_intent.id != second.payment_intent.id
+    (first_headers, _), (second_headers, _) = calls
+    assert first_headers["idempotency-key"] != second_headers["idempotency-key"]
+
+
+def test_idempotency_error_fails_the_checkout(mock_provider):
+    def handler(request):
+        if request.url.path == "/v1/payment_intents":
+            return httpx.Response(400, json={"error": {"type": "idempotency_error", "message": "Keys for idempotent requests can only be used with the same parameters they were first used with."}})
+        return stripe_api([])(request)
+
+    [response], _ = create_payment_intent(mock_provider, handler=handler)
+
+    assert not response.success
+    assert response.message == "A payment with different details is already in progress for this order"
+
+
+def test_idempotency_key_differs_per_order(mock_provider):
+    _, [(first_headers, _)] = create_payment_intent(mock_provider)
+    _, [(second_headers, _)] = create_payment_intent(mock_provider, checkouts=({**CHECKOUT, "order_id": "order-2"},))
+
+    assert first_headers["idempotency-key"] != second_headers["idempotency-key"]
+
+
+def test_card_not_saved_by_default(mock_provider):
+    _, [(_, body)] = create_payment_intent(mock_provider)
+
+    assert "setup_future_usage" not in body
+
+
+def test_card_saved_for_off_session_use_when_requested(mock_provider):
+    checkout = {**CHECKOUT, "payment_method": {**CHECKOUT["payment_method"], "save_payment_method": True}}
+    _, [(_, body)] = create_payment_intent(mock_provider, checkouts=(checkout,))
+
+    assert body["setup_future_usage"] == ["off_session"]
+
+
+def test_unknown_payment_intent_status_fails_the_checkout(mock_provider):
+    def handler(request):
+        if request.url.path == "/v1/payment_intents":
+            return httpx.Response(200, json={"id": "pi_1", "client_secret": "secret", "status": "some_new_status", "amount": 2100, "currency": "usd", "created": 1700000000})
+        return stripe_api([])(request)
+
+    [response], _ = create_payment_intent(mock_provider, handler=handler)
+
+    assert not response.success
+    assert response.status == "failed"